@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import functools
+import multiprocessing
 import sys
 from typing import Dict, List, Optional, Union
 
@@ -12,22 +13,71 @@ from PySide2.QtWidgets import *  # type: ignore
 from anitracker import logger
 from anitracker.anitracker import AniTracker
 from anitracker.background import *
-from anitracker.media import Anime, AnimeCollection
+from anitracker.media import Anime, AnimeCollection, AnimeFile
+from anitracker.models import AnimeFilterProxyModel, AnimeTableModel, ProgressDelegate
 from anitracker.signals import SignalConnector, MouseFilter
 from anitracker.ui import Ui_AnimeApp, Ui_AnimeInfo
-from anitracker.utilities import UserStatus
+from anitracker.utilities import TaskPriority, UserStatus
+
+# The tables shown through an AnimeTableModel, the generated UI makes them table
+# widgets and those can't be given a model
+MODEL_TABLES = (
+    "WatchingTable",
+    "CompletedTable",
+    "PlanningTable",
+    "PausedTable",
+    "DroppedTable",
+    "AnilistSearchResults",
+)
+
+
+def _table_view(table: QTableWidget) -> QTableView:
+    """Swaps a table widget for a view setup the same way, in the same place"""
+    parent = table.parentWidget()
+    view = QTableView(parent)
+    view.setObjectName(table.objectName())
+    view.setGeometry(table.geometry())
+    view.setContextMenuPolicy(table.contextMenuPolicy())
+    view.setStyleSheet(table.styleSheet())
+    view.setEditTriggers(table.editTriggers())
+    view.setAlternatingRowColors(table.alternatingRowColors())
+    view.setSelectionMode(table.selectionMode())
+    view.setSelectionBehavior(table.selectionBehavior())
+    view.setShowGrid(table.showGrid())
+    view.setGridStyle(table.gridStyle())
+    view.setSortingEnabled(table.isSortingEnabled())
+    view.setWordWrap(table.wordWrap())
+    view.setCornerButtonEnabled(table.isCornerButtonEnabled())
+
+    for old, new in (
+        (table.horizontalHeader(), view.horizontalHeader()),
+        (table.verticalHeader(), view.verticalHeader()),
+    ):
+        new.setVisible(not old.isHidden())
+        new.setHighlightSections(old.highlightSections())
+        new.setStretchLastSection(old.stretchLastSection())
+        new.setSortIndicatorShown(old.isSortIndicatorShown())
+
+    layout = parent.layout()
+    if layout is not None:
+        layout.replaceWidget(table, view)
+    table.deleteLater()
+
+    return view
 
 
 class MainWindow(QMainWindow):
     update_ui_signal = Signal(functools.partial)
-    insert_row_signal = Signal(QTableWidget, Anime)
-    update_row_signal = Signal(QTableWidget, int, Anime)
+    insert_row_signal = Signal(QTableView, Anime)
     reload_anime_eps = Signal()
     update_anilist_label = Signal(str)
-    update_label = Signal()
     handle_anime_updates = Signal()
+    anime_updated = Signal(AnimeCollection)
+    anime_removed = Signal(AnimeCollection)
     nyaa_results = Signal(list)
     add_episodes_to_widget = Signal(list, AnimeCollection)
+    episode_thumbnail_ready = Signal(AnimeFile, AnimeCollection, object)
+    anime_info_ready = Signal(Anime)
 
     # Setup stuff
     def __init__(self, qapp: QApplication):
@@ -38,6 +88,8 @@ class MainWindow(QMainWindow):
         self.setup_threads()
         self.setup_tables()
         self.connect_signals()
+        # Show the lists saved last time, they're synced with anilist in the background
+        self.signals.handle_anime_updates()
 
     def setup(self):
         self.ui = Ui_AnimeApp()
@@ -45,8 +97,8 @@ class MainWindow(QMainWindow):
         self.app = AniTracker()
         # Where all the signals lay
         self.signals = SignalConnector(self)
-        # A list of the status helpers
-        self.statuses: List[StatusHelper] = []
+        # The status helpers, the status bar is redrawn when these change
+        self.statuses = StatusRegistry(self)
         # A dict of the headers to whether they're enabled by default
         # TODO: Figure out how to make the header not go away when all columns are hidden
         self._header_labels = {
@@ -68,9 +120,13 @@ class MainWindow(QMainWindow):
             "anime_end_date": False,
             "episode_count": True,
             "average_score": True,
+            # Column widths are saved by position, so new columns go at the end
+            "available": False,
         }
         # Setup the app UI
         self.ui.setupUi(self)
+        for name in MODEL_TABLES:
+            setattr(self.ui, name, _table_view(getattr(self.ui, name)))
 
         # Add the filter line edit to the right of the tool box
         self.filter_anime = QLineEdit()
@@ -81,6 +137,10 @@ class MainWindow(QMainWindow):
             """
         )
         self.ui.toolBar.addWidget(self.filter_anime)
+        # The filter is applied once typing pauses, instead of on every key
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(int(self.app._config["filter_delay"]))
         # Ensure the pages/page chooser is set to the first index
         self.ui.AnimePages.setCurrentIndex(0)
         self.ui.AnimeListChooser.setCurrentRow(0)
@@ -88,43 +148,59 @@ class MainWindow(QMainWindow):
     def setup_threads(self):
         # Setup background stuff
         self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(max(4, QThread.idealThreadCount()))
+        # Anything that isn't a loop that runs forever goes through this
+        self.tasks = TaskScheduler(self.threadpool)
+        # Show when anilist requests are being held back by the rate limit
+        self.app._anilist.limiter.on_queue_change = AniListQueueStatus(self)
         self._threads_to_terminate: List[BackgroundThread] = []
-        # This will trigger the status label update
-        self.status_update_worker = BackgroundThread(status_label, self)
-        # Used for searching files in the background
-        self.update_worker = BackgroundThread(refresh_folder, self)
-        # This'll be the loop that automatically does so every 2 minutes
-        self._update_anime_files_loop = BackgroundThread(
-            refresh_folder, self, loop_forever=True
-        )
-        # Connecting to anilist
-        self.anilist_connector = BackgroundThread(connect_to_anilist, self)
-        # Anime updates
-        self.anime_updater = BackgroundThread(update_from_anilist, self)
-        # Will check for update in the background
-        self.update_checker = BackgroundThread(try_update, self)
+        # This'll watch the folder and automatically pick up changes
+        self._update_anime_files_loop = BackgroundThread(watch_folder, self)
+        # Sends list edits to anilist, they're queued so nothing waits on anilist
+        self._mutations_loop = BackgroundThread(sync_mutations, self)
 
         # Add them all to the termintable threads
-        self.status_update_worker.setTerminationEnabled(True)
-        self.update_worker.setTerminationEnabled(True)
         self._update_anime_files_loop.setTerminationEnabled(True)
-        self.anilist_connector.setTerminationEnabled(True)
-        self.anime_updater.setTerminationEnabled(True)
-        self.update_checker.setTerminationEnabled(True)
-        self._threads_to_terminate.append(self.status_update_worker)
-        self._threads_to_terminate.append(self.update_worker)
+        self._mutations_loop.setTerminationEnabled(True)
         self._threads_to_terminate.append(self._update_anime_files_loop)
-        self._threads_to_terminate.append(self.anilist_connector)
-        self._threads_to_terminate.append(self.anime_updater)
-        self._threads_to_terminate.append(self.update_checker)
+        self._threads_to_terminate.append(self._mutations_loop)
 
         # Start a few things in the background
         self._update_anime_files_loop.start()
-        self.anilist_connector.start()
-        self.status_update_worker.start()
+        self._mutations_loop.start()
+        self.tasks.submit(
+            connect_to_anilist,
+            self,
+            key="connect_to_anilist",
+            priority=TaskPriority.BACKGROUND,
+        )
+
+    # Used for searching files in the background
+    def reload_videos(self):
+        self.tasks.submit(
+            refresh_folder, self, key="refresh_folder", priority=TaskPriority.UI
+        )
+
+    # Anime updates, if one is already running it runs again once it's done.
+    # Anything but a full refresh only fetches what changed since the last one
+    def refresh_anilist(self, full: bool = True):
+        self.tasks.submit(
+            update_from_anilist,
+            self,
+            full,
+            key=("update_from_anilist", full),
+            priority=TaskPriority.BACKGROUND,
+            requeue=True,
+        )
+
+    # Will check for update in the background
+    def check_for_update(self):
+        self.tasks.submit(
+            try_update, self, key="try_update", priority=TaskPriority.BACKGROUND
+        )
 
     def setup_tables(self):
-        def default_table_setup(_table: QTableWidget, _headers: Dict):
+        def default_table_setup(_table: QTableView, _headers: Dict):
             # Create a menu per table
             menu = _table.menu = QMenu(self.ui.AnimeListTab)  # type: ignore
             menu.setStyleSheet("QMenu::item:selected {background-color: #007fd4}")
@@ -141,28 +217,46 @@ class MainWindow(QMainWindow):
             _table.horizontalHeader().setMinimumSectionSize(50)
             # Now set the custom context menu on the _table itself
             _table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+            # Several rows can be selected, the context menu applies to all of them
+            _table.setSelectionMode(QAbstractItemView.ExtendedSelection)
             _table.customContextMenuRequested.connect(  # type: ignore
                 functools.partial(self.signals.open_anime_context_menu, _table)
             )
             _table.viewport().installEventFilter(MouseFilter(_table, self))
-            _table.itemClicked.connect(self.signals.anime_clicked)  # type: ignore
             _table.horizontalHeader().sectionResized.connect(  # type: ignore
                 functools.partial(self.signals.resized_column, _table)
             )
 
-            headers = []
+            # Nyaa results aren't animes, it keeps its own items
+            if isinstance(_table, QTableWidget):
+                _table.itemClicked.connect(lambda _: self.hide_episode_list())  # type: ignore
+                _table.setColumnCount(len(_headers))
+                _table.setHorizontalHeaderLabels(
+                    [title.replace("_", " ").title() for title in _headers]
+                )
+            # Anime tables only hold a list of animes, the cells are read off them when drawn
+            else:
+                model = AnimeTableModel(self.app, list(_headers), _table)
+                proxy = AnimeFilterProxyModel(_table)
+                proxy.setSourceModel(model)
+                _table.setModel(proxy)
+                # Turning it on again sorts the new model by the header's sort indicator
+                _table.setSortingEnabled(_table.isSortingEnabled())
+                _table.clicked.connect(  # type: ignore
+                    functools.partial(self.signals.anime_clicked, _table)
+                )
+                if "progress" in model.columns:
+                    _table.setItemDelegateForColumn(
+                        model.columns.index("progress"), ProgressDelegate(_table)
+                    )
 
-            for title, enabled in _headers.items():
+            for index, (title, enabled) in enumerate(_headers.items()):
                 # Get the pretty title for the action menu
                 pretty_title = title.lower().replace("_", " ").title()
-                headers.append(pretty_title)
                 # Create the action menu entry
                 action = QAction(pretty_title, _table.horizontalHeader())
                 # Set them as checkable
                 action.setCheckable(True)
-                # Add column to _table
-                _table.insertColumn(_table.columnCount())
-                index = _table.columnCount() - 1
                 # If it's enabled, set action as true and don't hide row
                 if enabled:
                     action.setChecked(True)
@@ -179,9 +273,6 @@ class MainWindow(QMainWindow):
                 if size is not None:
                     _table.setColumnWidth(index, int(size))
 
-            # Setting headers has to come after
-            _table.setHorizontalHeaderLabels(headers)
-
         user_settings = [
             "user_status",
             "score",
@@ -190,6 +281,7 @@ class MainWindow(QMainWindow):
             "updated_at",
             "start_date",
             "end_date",
+            "available",
         ]
         _anilist_search_headers = {
             k: v
@@ -224,25 +316,33 @@ class MainWindow(QMainWindow):
 
     def connect_signals(self):
         self.insert_row_signal.connect(self.signals.insert_row)  # type: ignore
-        self.update_row_signal.connect(self.signals.update_row)  # type: ignore
-        self.filter_anime.textChanged.connect(self.signals.filter_row)  # type: ignore
-        self.update_label.connect(self.signals.update_status)  # type: ignore
+        self.anime_updated.connect(self.signals.update_anime_row)  # type: ignore
+        self.anime_removed.connect(self.signals.remove_anime_row)  # type: ignore
+        self.filter_anime.textChanged.connect(lambda _: self.filter_timer.start())  # type: ignore
+        self.filter_timer.timeout.connect(self.signals.filter_row)  # type: ignore
+        self.statuses.changed.connect(self.signals.update_status)  # type: ignore
         self.reload_anime_eps.connect(self.signals.handle_anime_updates)  # type: ignore
         self.update_ui_signal.connect(self.signals.handle_ui_update)  # type: ignore
         self.handle_anime_updates.connect(self.signals.handle_anime_updates)  # type: ignore
         self.add_episodes_to_widget.connect(self.signals.add_episodes_to_episode_list)  # type: ignore
+        self.episode_thumbnail_ready.connect(self.signals.set_episode_thumbnail)  # type: ignore
+        self.nyaa_results.connect(self.signals.nyaa_results)  # type: ignore
+        self.anime_info_ready.connect(self.show_anime_settings)  # type: ignore
         self.ui.AnilistSearchButton.clicked.connect(self.signals.search_anilist)  # type: ignore
         self.ui.NyaaSearchButton.clicked.connect(self.signals.search_nyaa)  # type: ignore
         self.ui.AnimeListChooser.currentRowChanged.connect(self.signals.change_page)  # type: ignore
         self.ui.actionSettings.triggered.connect(self.signals.open_settings)  # type: ignore
-        self.ui.actionRefresh.triggered.connect(self.anime_updater.start)  # type: ignore
-        self.ui.actionReload_Videos.triggered.connect(self.update_worker.start)  # type: ignore
+        self.ui.actionRefresh.triggered.connect(lambda: self.refresh_anilist())  # type: ignore
+        self.ui.actionReload_Videos.triggered.connect(self.reload_videos)  # type: ignore
         self.ui.actionAbout.triggered.connect(self.signals.open_about)  # type: ignore
         self.ui.actionReport_bug.triggered.connect(self.signals.open_issue_tracker)  # type: ignore
         self.ui.actionSource_code.triggered.connect(self.signals.open_repo)  # type: ignore
-        self.ui.actionUpdateCheck.triggered.connect(self.update_checker.start)  # type: ignore
+        self.ui.actionUpdateCheck.triggered.connect(self.check_for_update)  # type: ignore
 
     def stop_threads(self):
+        self.tasks.shutdown()
+        self.app._anilist.close()
+        self.app._thumbnails.close()
         for thread in self._threads_to_terminate:
             if thread.isRunning():
                 thread.terminate()
@@ -254,7 +354,7 @@ class MainWindow(QMainWindow):
         return [x.replace("_", " ").title() for x in self._header_labels.keys()]
 
     @property
-    def tables(self) -> List[QTableWidget]:
+    def tables(self) -> List[QTableView]:
         return [
             self.ui.CompletedTable,
             self.ui.WatchingTable,
@@ -273,7 +373,7 @@ class MainWindow(QMainWindow):
             self.setFixedSize(*self._with_eps)  # type: ignore
             self._showing_episodes = True
 
-    def get_table(self, status: UserStatus) -> QTableWidget:
+    def get_table(self, status: UserStatus) -> QTableView:
         if status is UserStatus.COMPLETED:
             return self.ui.CompletedTable
         elif status in (UserStatus.CURRENT, UserStatus.REPEATING):
@@ -287,9 +387,13 @@ class MainWindow(QMainWindow):
 
         raise TypeError(f"Cannot find table for {status}")
 
+    def model(self, table: QTableView) -> AnimeTableModel:
+        """The animes shown in this table, under its sort/filter proxy"""
+        return table.model().sourceModel()  # type: ignore
+
     def get_headers(
         self,
-        table: QTableWidget,
+        table: QTableView,
         *,
         _headers: Optional[Dict[str, bool]] = None,
     ) -> Dict[str, bool]:
@@ -310,7 +414,30 @@ class MainWindow(QMainWindow):
 
         return headers
 
+    def visible_attributes(self, table: QTableView) -> List[str]:
+        """The anime attributes the table's visible columns show"""
+        return [
+            attribute
+            for index, attribute in enumerate(self.model(table).columns)
+            if not table.isColumnHidden(index)
+        ]
+
     def open_anime_settings(self, anime: Union[Anime, AnimeCollection]):
+        # Search results only have what was needed for the table, the rest is
+        # fetched in the background and the info opens once it's there
+        if not isinstance(anime, AnimeCollection):
+            self.tasks.submit(
+                fetch_full_anime,
+                self,
+                anime,
+                key=("fetch_full_anime", anime.id),
+                priority=TaskPriority.UI,
+            )
+            return
+
+        self.show_anime_settings(anime)
+
+    def show_anime_settings(self, anime: Union[Anime, AnimeCollection]):
         # Anime settings stuff
         m = self.anime_menu = QTabWidget()
         s = self.anime_window = Ui_AnimeInfo()
@@ -359,6 +486,8 @@ sys.excepthook = handle_exception
 
 
 def main():
+    # Library scans parse files in worker processes, which need this when frozen
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
 
     window = MainWindow(app)
@@ -1,98 +1,189 @@
 from __future__ import annotations
 
+from dataclasses import fields
 from pathlib import Path
+import threading
 from typing import (
     TYPE_CHECKING,
+    Any,
     Dict,
-    Generator,
+    Iterable,
     Iterator,
     List,
     Optional,
+    Sequence,
     Tuple,
+    Type,
     Union,
 )
 
+import numpy as np
 import requests
-from aniparser import parse
 from bs4 import BeautifulSoup as bs
 from bs4.element import Tag
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 from anitracker import user_agent, logger
-from anitracker.config import Config
-from anitracker.media import AnimeCollection, AnimeFile, MangaCollection
+from anitracker.cache import ListStore, MediaCache, MetadataCache, ThumbnailCache
+from anitracker.config import CONFIG_LOCATION, Config
+from anitracker.library import LibraryDiff, LibraryScanner
+from anitracker.media import (
+    Anime,
+    AnimeCollection,
+    AnimeFile,
+    EpisodeAvailability,
+    MangaCollection,
+)
 from anitracker.media.anime import NyaaResult
-from anitracker.sync import AniList
+from anitracker.sync import AniList, MutationQueue
 from anitracker.player import Player
+from anitracker.utilities import UserStatus
 
 if TYPE_CHECKING:
     from anitracker.__main__ import MainWindow
 
     EPISODE_MATCH_TYPE = Dict[int, List[Tuple[AnimeFile, int]]]
+    INDEX_SIGNATURE_TYPE = Tuple[Tuple[str, ...], int]
 
-video_file_extensions = [
-    "webm",
-    "mkv",
-    "flv",
-    "flv",
-    "vob",
-    "ogv",
-    "ogg",
-    "drc",
-    "gif",
-    "gifv",
-    "mng",
-    "avi",
-    "mts",
-    "m2ts",
-    "ts",
-    "mov",
-    "qt",
-    "wmv",
-    "yuv",
-    "rm",
-    "rmvb",
-    "viv",
-    "asf",
-    "amv",
-    "mp4",
-    "m4p",
-    "m4v",
-    "mpg",
-    "mp2",
-    "mpeg",
-    "mpe",
-    "mpv",
-    "mpg",
-    "mpeg",
-    "m2v",
-    "m4v",
-    "svi",
-    "3gp",
-    "3g2",
-    "mxf",
-    "roq",
-    "nsv",
-    "flv",
-    "f4v",
-    "f4p",
-    "f4a",
-    "f4b",
-]
-subtitle_file_extensions = ["ass", "cmml", "lrc", "sami", "ttml", "srt", "ssa", "usf"]
 processor = lambda x: x.lower()
 
 
+def _ratio(s1: str, s2: str) -> float:
+    return fuzz.ratio(s1, s2, processor=processor)
+
+
+def _season_title(title: Optional[str], season: int) -> str:
+    return f"{title} {season}"
+
+
+class TitleScores:
+    """The fuzzy ratios of every file title against every anime title, scored in
+    one batched cdist call. Any pair that wasn't part of the batch falls back to
+    scoring it directly, so this can always be used in place of fuzz.ratio"""
+
+    def __init__(
+        self,
+        episodes: Sequence[AnimeFile],
+        titles: Sequence[str],
+        *,
+        workers: int = -1,
+    ) -> None:
+        queries: Dict[str, int] = {}
+
+        # The file titles, both on their own and the season appended ones culling uses
+        for ep in episodes:
+            for title in (ep.title, ep.alternate_title):
+                if title is None:
+                    continue
+                queries.setdefault(title, len(queries))
+                queries.setdefault(_season_title(title, ep.season), len(queries))
+
+        # Empty titles are left out, they're what missing titles are set to
+        choices: Dict[str, int] = {}
+        for title in titles:
+            if title:
+                choices.setdefault(title, len(choices))
+
+        self._queries = queries
+        self._choices = choices
+        self._matrix = np.zeros((len(queries), len(choices)), dtype=np.float32)
+
+        if queries and choices:
+            self._matrix = process.cdist(
+                list(queries),
+                list(choices),
+                scorer=fuzz.ratio,
+                processor=processor,
+                workers=workers,
+                dtype=np.float32,
+            )
+
+    def ratio(self, query: str, choice: str) -> float:
+        row = self._queries.get(query)
+        col = self._choices.get(choice)
+
+        if row is None or col is None:
+            return _ratio(query, choice)
+
+        return float(self._matrix[row, col])
+
+    def best_for_episodes(
+        self, episodes: Sequence[AnimeFile], titles: Sequence[str]
+    ) -> np.ndarray:
+        """Returns the best ratio of each episode's title/alternate title against
+        any of the titles provided, in the same order as the episodes"""
+        cols = [self._choices[t] for t in titles if t in self._choices]
+
+        if not cols or not episodes:
+            return np.zeros(len(episodes), dtype=np.float32)
+
+        # A missing alternate title just scores the title again, which can't
+        # change the max
+        rows = [self._queries[ep.title] for ep in episodes]
+        alt_rows = [
+            self._queries[ep.alternate_title] if ep.alternate_title else row
+            for ep, row in zip(episodes, rows)
+        ]
+
+        best = self._matrix[np.ix_(rows, cols)].max(axis=1)
+        alt_best = self._matrix[np.ix_(alt_rows, cols)].max(axis=1)
+
+        return np.maximum(best, alt_best)
+
+
 class AniTracker:
     def __init__(self) -> None:
         self._config = Config()
+        # Both of these are keyed by the media id, not the list entry id
         self._animes: Dict[int, AnimeCollection] = {}
-
-        self._anilist = AniList()
+        self._mangas: Dict[int, MangaCollection] = {}
+        # The newest updatedAt seen per list type, changes since then are all
+        # a delta sync needs to fetch
+        self._sync_cursors: Dict[str, int] = {}
+        self._sync_lock = threading.Lock()
+
+        self._anilist = AniList(
+            pool_size=self._config["anilist_pool_size"],
+            timeout=self._config["anilist_timeout"],
+        )
         self._episodes: List[AnimeFile] = []
         self.standalone_subtitles: Dict[Tuple[str, int], str] = {}
         self._anilist.from_config(self._config)
 
+        self._cache = MetadataCache(
+            (CONFIG_LOCATION / "cache.sqlite3").expanduser(),
+            max_entries=self._config["cache_max_entries"],
+        )
+        self._media_cache = MediaCache(
+            (CONFIG_LOCATION / "media.sqlite3").expanduser()
+        )
+        self._store = ListStore((CONFIG_LOCATION / "lists.sqlite3").expanduser())
+        self._mutations = MutationQueue(
+            (CONFIG_LOCATION / "mutations.sqlite3").expanduser()
+        )
+        self._thumbnails = ThumbnailCache(
+            (CONFIG_LOCATION / "thumbnails").expanduser(),
+            workers=self._config["thumbnail_workers"],
+        )
+        self._scanner: Optional[LibraryScanner] = None
+        self._scan_lock = threading.Lock()
+
+        # The match index, anime id -> culled episodes for that anime. The signatures
+        # are what the entry was built from, so we know when it needs to be rebuilt
+        self._episode_index: Dict[int, Dict[int, AnimeFile]] = {}
+        self._index_signatures: Dict[int, INDEX_SIGNATURE_TYPE] = {}
+        # Which episodes have files, built along with the index. Animes the index
+        # doesn't have yet are kept separately until the next index update
+        self._availability: Dict[int, EpisodeAvailability] = {}
+        self._unindexed_availability: Dict[
+            int, Tuple[INDEX_SIGNATURE_TYPE, EpisodeAvailability]
+        ] = {}
+        self._indexed_episodes: List[AnimeFile] = []
+        self._index_lock = threading.Lock()
+
+        # Whatever was there last time is shown until anilist has been synced with
+        self._load_local_lists()
+
     @property
     def animes(self) -> Dict[int, AnimeCollection]:
         return self._animes.copy()
@@ -106,11 +197,29 @@ class AniTracker:
         inst.refresh_from_anilist()
         return inst
 
-    def missing_eps(self, anime: AnimeCollection) -> str:
-        have = [ep.episode_number for ep in self.get_episodes(anime)]
-        missing = [f"{n}" for n in range(1, anime.episode_count + 1) if n not in have]
+    def availability(self, anime: AnimeCollection) -> EpisodeAvailability:
+        """Which episodes of the anime there are files for"""
+        signature = self._index_signature(anime)
+        availability = self._availability.get(anime.id)
+
+        if (
+            availability is not None
+            and self._index_signatures.get(anime.id) == signature
+        ):
+            return availability
+
+        # Anything added since the last index update won't be in there yet. It's
+        # only culled once, not every time a table asks
+        unindexed = self._unindexed_availability.get(anime.id)
+        if unindexed is not None and unindexed[0] == signature:
+            return unindexed[1]
 
-        return ", ".join(missing)
+        availability = EpisodeAvailability.from_episodes(
+            self._episodes_in_index(anime), anime.episode_count
+        )
+        self._unindexed_availability[anime.id] = (signature, availability)
+
+        return availability
 
     def get_anime(
         self,
@@ -137,9 +246,113 @@ class AniTracker:
         return None
 
     def remove_anime(self, id: int):
-        del self._animes[id]
+        self._animes.pop(id, None)
+        self._store.remove(id)
+
+    def edit_anime(self, anime: Union[Anime, AnimeCollection], **kwargs):
+        """Edits the anime's list entry. The change is applied straight away,
+        and queued to be sent to anilist in the background"""
+        self.edit_animes([(anime, kwargs)])
+
+    def edit_animes(
+        self, edits: Iterable[Tuple[Union[Anime, AnimeCollection], Dict[str, Any]]]
+    ):
+        """Edits many list entries, each anime with its own edit_anime kwargs.
+        They're all queued at once"""
+        payloads: Dict[int, Dict[str, Any]] = {}
+
+        for anime, kwargs in edits:
+            payload = anime.edit_payload(**kwargs)
+
+            if isinstance(anime, AnimeCollection):
+                anime.update_user_data(payload)
+
+            payloads[anime.id] = {**payloads.get(anime.id, {}), **payload}
+
+        self._mutations.update_many(payloads)
+
+    def get_full_anime(self, anime: Anime) -> Anime:
+        """Search results only have what the search table shows, this returns
+        the anime with everything filled in"""
+        media = self._get_media([anime.id])
 
-    def refresh_from_anilist(self):
+        if anime.id not in media:
+            return anime
+
+        return Anime.from_anilist(media[anime.id])
+
+    def delete_anime(self, anime: AnimeCollection):
+        self.delete_animes([anime])
+
+    def delete_animes(self, animes: Iterable[AnimeCollection]):
+        list_ids = {anime.id: anime._list_id for anime in animes}
+
+        for id in list_ids:
+            self._animes.pop(id, None)
+
+        self._store.remove_many(list_ids)
+        self._mutations.delete_many(list_ids)
+
+    def flush_mutations(self) -> Tuple[bool, bool]:
+        """Sends any queued edits to anilist. Returns whether everything was
+        sent, and whether any entries were added to the lists, those need a
+        sync before they can be shown"""
+        done, emptied = self._mutations.flush(self._anilist)
+        added = False
+
+        for mutation, entry in done:
+            if mutation.kind != "update":
+                continue
+
+            anime = self._animes.get(mutation.media_id)
+
+            if anime is None:
+                added = True
+            else:
+                self._store.update("ANIME", [entry])
+                anime.update_user_data({"updatedAt": entry["updatedAt"]})
+
+        return emptied, added
+
+    def _apply_pending(self):
+        # Anything anilist doesn't have yet would otherwise be undone by a sync
+        for mutation in self._mutations.pending():
+            if mutation.kind == "delete":
+                self._animes.pop(mutation.media_id, None)
+            elif (anime := self._animes.get(mutation.media_id)) is not None:
+                anime.update_user_data(mutation.payload)
+
+    def _load_local_lists(self):
+        for _type, collections, cls in (
+            ("ANIME", self._animes, AnimeCollection),
+            ("MANGA", self._mangas, MangaCollection),
+        ):
+            entries, cursor = self._store.load(_type)
+
+            for entry in self._fill_media(entries, fetch=False):
+                collections[entry["mediaId"]] = cls.from_anilist(entry)
+
+            if entries:
+                self._sync_cursors[_type] = cursor
+
+        self._apply_pending()
+        logger.debug(f"Loaded {len(self._animes)} animes from the local lists")
+
+    def refresh_from_anilist(self, *, full: bool = True):
+        """Syncs the lists with anilist. A full sync downloads every list, otherwise
+        only entries updated since the last sync are fetched and merged in. Entries
+        deleted elsewhere are only noticed by a full sync"""
+        with self._sync_lock:
+            if full or not self._sync_cursors:
+                self._full_sync()
+            else:
+                self._delta_sync()
+
+            self._apply_pending()
+
+        self._update_episode_index()
+
+    def _full_sync(self):
         # First get all the media
         logger.debug(f"Retrieving info from anilist")
         animes = self._anilist.get_anime()
@@ -147,21 +360,116 @@ class AniTracker:
 
         _animes: Dict[int, AnimeCollection] = {}
         _mangas: Dict[int, MangaCollection] = {}
+        cursors: Dict[str, int] = {"ANIME": 0, "MANGA": 0}
 
         # The lists are separated by status
-        for l in animes["data"]["MediaListCollection"]["lists"]:
-            for entry in l["entries"]:
-                _animes[entry["id"]] = AnimeCollection.from_anilist(entry)
-        for l in mangas["data"]["MediaListCollection"]["lists"]:
-            for entry in l["entries"]:
-                _mangas[entry["id"]] = MangaCollection.from_anilist(entry)
+        anime_entries = [
+            entry
+            for l in animes["data"]["MediaListCollection"]["lists"]
+            for entry in l["entries"]
+        ]
+        manga_entries = [
+            entry
+            for l in mangas["data"]["MediaListCollection"]["lists"]
+            for entry in l["entries"]
+        ]
+
+        for entry in self._fill_media(anime_entries):
+            _animes[entry["mediaId"]] = AnimeCollection.from_anilist(entry)
+            cursors["ANIME"] = max(cursors["ANIME"], entry["updatedAt"] or 0)
+        for entry in self._fill_media(manga_entries):
+            _mangas[entry["mediaId"]] = MangaCollection.from_anilist(entry)
+            cursors["MANGA"] = max(cursors["MANGA"], entry["updatedAt"] or 0)
+
+        self._store.replace("ANIME", anime_entries, cursors["ANIME"])
+        self._store.replace("MANGA", manga_entries, cursors["MANGA"])
 
         self._animes = _animes
         self._mangas = _mangas
+        self._sync_cursors = cursors
+
+    def _get_media(self, ids: Iterable[int], *, fetch: bool = True) -> Dict[int, Dict]:
+        """Returns the media for these ids from the media cache. Only media missing
+        from it, or stale in it, is fetched"""
+        media, needed = self._media_cache.get_many(ids)
+
+        if needed and fetch:
+            logger.debug(f"Retrieving {len(needed)} media from anilist")
+
+            try:
+                fetched = self._anilist.get_media(needed)
+            # Stale data is better than nothing
+            except requests.RequestException as e:
+                logger.error(
+                    "Could not retrieve media", exc_info=(type(e), e, e.__traceback__)
+                )
+            else:
+                self._media_cache.set_many(fetched)
+                media.update((m["id"], m) for m in fetched)
+
+        return media
+
+    def _fill_media(self, entries: List[Dict], *, fetch: bool = True) -> List[Dict]:
+        """List entries are fetched without their media, this fills it in"""
+        media = self._get_media({e["mediaId"] for e in entries}, fetch=fetch)
+        filled: List[Dict] = []
+
+        for entry in entries:
+            if entry["mediaId"] not in media:
+                logger.warning(f"No media found for list entry {entry['id']}")
+                continue
+
+            entry["media"] = media[entry["mediaId"]]
+            filled.append(entry)
+
+        return filled
+
+    def _delta_sync(self):
+        logger.debug(f"Retrieving changes from anilist")
+        self._merge_entries("ANIME", self._animes, AnimeCollection)
+        self._merge_entries("MANGA", self._mangas, MangaCollection)
+
+    def _merge_entries(
+        self,
+        _type: str,
+        collections: Dict,
+        cls: Union[Type[AnimeCollection], Type[MangaCollection]],
+    ):
+        cursor = self._sync_cursors.get(_type, 0)
+        # Anything updated in the same second as the cursor may not have been seen
+        entries = self._fill_media(self._anilist.get_updated_entries(_type, cursor))
+
+        for entry in entries:
+            updated = cls.from_anilist(entry)
+            existing = collections.get(entry["mediaId"])
+
+            # Update what's there, so anything holding onto it sees the changes
+            if existing is None:
+                collections[entry["mediaId"]] = updated
+            else:
+                for field in fields(updated):
+                    setattr(existing, field.name, getattr(updated, field.name))
+
+            cursor = max(cursor, entry["updatedAt"] or 0)
+
+        logger.debug(f"Merged {len(entries)} updated {_type.lower()} entries")
+        self._sync_cursors[_type] = cursor
+        self._store.update(_type, entries, cursor)
+
+    def _episodes_in_index(self, anime: AnimeCollection) -> Dict[int, AnimeFile]:
+        episodes = self._episode_index.get(anime.id)
+
+        # Anything added since the last index update won't be in there yet
+        if episodes is None or self._index_signatures.get(
+            anime.id
+        ) != self._index_signature(anime):
+            episodes = self._cull_episodes_for_anime(anime)
+
+        return episodes
 
     def get_episodes(self, anime: AnimeCollection) -> List[AnimeFile]:
 
-        episodes = list(self._cull_episodes_for_anime(anime).values())
+        episodes = list(self._episodes_in_index(anime).values())
 
         # Sort it for ease of use
         episodes.sort(key=lambda e: e.episode_number)
@@ -171,9 +479,23 @@ class AniTracker:
     def get_episode(
         self, anime: AnimeCollection, episode_num: int
     ) -> Optional[AnimeFile]:
-        episodes = self._cull_episodes_for_anime(anime, episode_num=episode_num)
+        return self._episodes_in_index(anime).get(episode_num)
+
+    def prefetch_thumbnails(self):
+        """Queues up thumbnails for the unwatched episodes of everything being
+        watched, these get generated whenever nothing else is"""
+        if not self._config["thumbnail_prefetch"]:
+            return
+
+        episodes = [
+            ep
+            for anime in self._animes.values()
+            if anime.user_status in (UserStatus.CURRENT, UserStatus.REPEATING)
+            for ep in self.get_episodes(anime)
+            if ep.episode_number > anime.progress
+        ]
 
-        return episodes.get(episode_num)
+        self._thumbnails.prefetch(episodes)
 
     def play_episode(
         self, anime: AnimeCollection, episode_num: int, window: MainWindow
@@ -229,63 +551,163 @@ class AniTracker:
 
         return False
 
-    def _refresh_anime_folder(self):
+    def _refresh_anime_folder(
+        self, directories: Optional[Iterable[str]] = None
+    ) -> LibraryDiff:
+        """Rescans the anime folder, or only the directories given if those
+        are known to be the only ones that changed"""
         try:
             dir = Path(self._config["animedir"]).expanduser()
         # No config setup for user, can't get anime
         except (KeyError, TypeError):
-            return
+            return LibraryDiff()
+
+        with self._scan_lock:
+            # Start over if the anime folder was changed
+            if self._scanner is None or self._scanner.root != dir:
+                logger.info(f"Loading anime folder: {dir}")
+                self._scanner = LibraryScanner(
+                    dir,
+                    cache=self._cache,
+                    workers=self._config["scan_workers"],
+                    ignore=self._config["ignore_patterns"],
+                )
+                directories = None
+
+            diff = self._scanner.scan(directories)
+
+            # Nothing changed, nothing to update
+            if not diff and self._scanner.episodes is self._episodes:
+                return diff
+
+            # Swap the lists in one go since other threads may be reading from them
+            self._episodes = self._scanner.episodes
+            self.standalone_subtitles = self._scanner.subtitles
+
+        logger.info(f"Reloaded anime folder: {dir} {diff}")
+        self._update_episode_index()
+
+        return diff
+
+    @staticmethod
+    def _index_signature(anime: AnimeCollection) -> INDEX_SIGNATURE_TYPE:
+        return (tuple(anime.titles), anime.episode_count)
+
+    def _update_episode_index(self):
+        """Updates the anime id -> episodes index. Only the animes that were added,
+        had their titles/episode count change, or that match any file that was
+        added or removed since the last update get culled again"""
+        with self._index_lock:
+            episodes = self._episodes
+            animes = list(self._animes.values())
+
+            index = self._episode_index.copy()
+            signatures = self._index_signatures.copy()
+            availability = self._availability.copy()
+
+            current = {anime.id for anime in animes}
+            # Drop anything that's no longer on the lists
+            for id in set(index) - current:
+                del index[id]
+                del signatures[id]
+                availability.pop(id, None)
+
+            outdated = [
+                anime
+                for anime in animes
+                if signatures.get(anime.id) != self._index_signature(anime)
+            ]
+
+            # The scanner keeps the same file objects around for files that didn't
+            # change, so anything that isn't in both is what was added or removed
+            new_ids = {id(ep) for ep in episodes}
+            old_ids = {id(ep) for ep in self._indexed_episodes}
+            changed = [ep for ep in episodes if id(ep) not in old_ids] + [
+                ep for ep in self._indexed_episodes if id(ep) not in new_ids
+            ]
+
+            if changed:
+                _outdated = {anime.id for anime in outdated}
+                up_to_date = [anime for anime in animes if anime.id not in _outdated]
+                changed_scores = TitleScores(
+                    changed,
+                    [title for anime in up_to_date for title in anime.titles],
+                    workers=self._config["match_workers"],
+                )
+                # Only animes that match one of the changed files could be affected
+                outdated.extend(
+                    anime
+                    for anime in up_to_date
+                    if (
+                        changed_scores.best_for_episodes(changed, anime.titles) >= 80
+                    ).any()
+                )
 
-        logger.info(f"Reloading anime folder: {dir}")
-        # Clear the dict
-        self._episodes.clear()
-        # Search through directory
-        self._episodes = list(self._probe_dir(dir))
-
-    def _probe_dir(self, path: Path) -> Generator[AnimeFile, None, None]:
-        # Look at every file in the path
-        for file in path.rglob("*"):
-            # Ignore directories, recursion is handled by rglob
-            if file.is_dir():
-                continue
+            # Score every file against every title that needs culling in one go
+            scores = TitleScores(
+                episodes,
+                [title for anime in outdated for title in anime.titles],
+                workers=self._config["match_workers"],
+            )
+
+            for anime in outdated:
+                before = index.get(anime.id)
+                index[anime.id] = self._cull_episodes_for_anime(
+                    anime, _episodes=episodes, _scores=scores
+                )
 
-            data = parse(file)
-            # Skip if it doesn't match the format for anime
-            if not data["is_anime"]:
-                continue
-            # Assume it's a movie
-            if "episode" not in data:
-                data["episode"] = "1"
-
-            # If it's a video file just yield it
-            if data.get("extension", "").lower() in video_file_extensions:
-                result = AnimeFile.from_data(data)
-                if isinstance(result, list):
-                    for r in result:
-                        yield r
-                elif isinstance(result, AnimeFile):
-                    yield result
-            # Otherwise if it's a subtitle track, store it
-            if data.get("extension", "").lower() in subtitle_file_extensions:
-                self.standalone_subtitles[
-                    (data["anime_title"], int(data["episode"]))
-                ] = str(file)
+                # If only files changed, just the episodes that came or went are
+                # flipped. Otherwise it has to be built again
+                previous = availability.get(anime.id)
+                if (
+                    before is not None
+                    and previous is not None
+                    and signatures.get(anime.id) == self._index_signature(anime)
+                ):
+                    previous = previous.copy()
+                    for n in before.keys() - index[anime.id].keys():
+                        previous.discard(n)
+                    for n in index[anime.id].keys() - before.keys():
+                        previous.add(n)
+                    availability[anime.id] = previous
+                else:
+                    availability[anime.id] = EpisodeAvailability.from_episodes(
+                        index[anime.id], anime.episode_count
+                    )
+
+                signatures[anime.id] = self._index_signature(anime)
+
+            rebuilt = len(outdated)
+
+            # Assign everything at the end, readers never see a half built index
+            self._episode_index = index
+            self._index_signatures = signatures
+            self._availability = availability
+            self._unindexed_availability = {}
+            self._indexed_episodes = episodes
+
+        logger.debug(f"Rebuilt episode index for {rebuilt} animes")
 
     def _cull_episodes_for_anime(
         self,
         anime: AnimeCollection,
         *,
         episode_num: Optional[int] = None,
+        _episodes: Optional[List[AnimeFile]] = None,
+        _scores: Optional[TitleScores] = None,
     ) -> Dict[int, AnimeFile]:
         culled: Dict[int, AnimeFile] = {}
-        episodes = self._episodes_for_anime(anime, episode_num=episode_num)
+        ratio_for = _scores.ratio if _scores is not None else _ratio
+        episodes = self._episodes_for_anime(
+            anime, episode_num=episode_num, _episodes=_episodes, _scores=_scores
+        )
 
         # Loop through each episode number we have available
         for ep_num, episodes_for_num in episodes.items():
             # This is our culled episodes for this episode number
             _culled_eps: List[AnimeFile] = []
             # Track the largest ratio that's been found
-            _largest: int = 0
+            _largest: float = 0
 
             # Now this is the main reason why this is needed... animes aren't
             # really in "seasons" like western shows. However, since this is what
@@ -300,18 +722,12 @@ class AniTracker:
             # Loop through the episodes
             for ep, _ in episodes_for_num:
                 # Track the largest ratio for this episode
-                _largest_for_ep: int = 0
+                _largest_for_ep: float = 0
 
                 for _title in anime.titles:
-                    ratio: int = fuzz.ratio(
-                        _title, f"{ep.title} {ep.season}", processor=processor
-                    )
-                    alt_ratio: int = (
-                        fuzz.ratio(
-                            _title,
-                            f"{ep.alternate_title} {ep.season}",
-                            processor=processor,
-                        )
+                    ratio = ratio_for(_season_title(ep.title, ep.season), _title)
+                    alt_ratio = (
+                        ratio_for(_season_title(ep.alternate_title, ep.season), _title)
                         if ep.alternate_title
                         else 0
                     )
@@ -411,7 +827,12 @@ class AniTracker:
         return culled
 
     def _episodes_for_anime(
-        self, anime: AnimeCollection, *, episode_num: Optional[int] = None
+        self,
+        anime: AnimeCollection,
+        *,
+        episode_num: Optional[int] = None,
+        _episodes: Optional[List[AnimeFile]] = None,
+        _scores: Optional[TitleScores] = None,
     ) -> EPISODE_MATCH_TYPE:
         """This is a naive method, it does a fuzzy match to see if
         it thinks the episode matches the anime. It returns a dict of
@@ -419,17 +840,37 @@ class AniTracker:
         and the ratio that fuzzy matching returned
 
         If the episode kwarg is provided then this will only match for episodes
-        of that number"""
+        of that number
+
+        When batched scores are provided the thresholding is read straight from
+        the score matrix instead of scoring each file"""
         ret: EPISODE_MATCH_TYPE = {}
 
-        for episode in self._episodes:
+        if _episodes is None:
+            _episodes = self._episodes
+
+        episodes = [
+            episode
+            for episode in _episodes
             # If we've specified the number to find, and this isn't that skip
-            if episode_num is not None and episode_num != episode.episode_number:
-                continue
+            if (episode_num is None or episode_num == episode.episode_number)
             # Also skip if this episode number is higher than the max for this season
-            if episode.episode_number > anime.episode_count:
-                continue
+            and episode.episode_number <= anime.episode_count
+        ]
+
+        if _scores is not None:
+            best = _scores.best_for_episodes(episodes, anime.titles)
+
+            # If it is over 80% then it's a "match"
+            for i in np.nonzero(best >= 80)[0]:
+                episode = episodes[i]
+                ret.setdefault(episode.episode_number, []).append(
+                    (episode, int(best[i]))
+                )
+
+            return ret
 
+        for episode in episodes:
             best_match: Optional[Tuple[AnimeFile, int]] = None
 
             for _title in anime.titles:
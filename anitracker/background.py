@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 import functools
 import os
 import shutil
 import sys
 import tempfile
+import threading
 import traceback
-from time import sleep
-from typing import Any, TYPE_CHECKING, Optional, Union, Callable, Iterator, List
+from concurrent.futures import Future
+from pathlib import Path
+from time import monotonic, sleep
+from typing import (
+    Any,
+    TYPE_CHECKING,
+    Dict,
+    Hashable,
+    Optional,
+    Union,
+    Callable,
+    Iterator,
+    List,
+    Set,
+)
 
 import requests
 from PySide2.QtCore import *  # type: ignore
@@ -16,25 +31,34 @@ from PySide2.QtWidgets import *  # type: ignore
 
 from anitracker import logger, frozen_path
 from anitracker.media import AnimeCollection, Anime, AnimeFile
-from anitracker.utilities import subprocess
+from anitracker.sync import AsyncAniList
+from anitracker.utilities import TaskPriority, subprocess
+from anitracker.watcher import InotifyWatcher
 
 if TYPE_CHECKING:
     from anitracker.__main__ import MainWindow
 
 __all__ = (
     "BackgroundThread",
+    "Task",
+    "TaskScheduler",
+    "current_task",
     "download_helper",
     "play_episode",
     "refresh_folder",
+    "watch_folder",
     "connect_to_anilist",
     "update_from_anilist",
-    "status_label",
     "try_update",
     "edit_anime",
+    "fetch_full_anime",
+    "sync_mutations",
     "search_nyaa",
     "search_anilist",
     "generate_thumbnails",
+    "AniListQueueStatus",
     "StatusHelper",
+    "StatusRegistry",
 )
 
 # For some reason there doesn't seem to be a way to simply use a callable for a thread
@@ -59,7 +83,186 @@ class BackgroundThread(QThread):
             traceback.print_exc()
 
 
-def download_helper(url: str) -> Iterator[str]:
+_local = threading.local()
+
+
+def current_task() -> Optional[Task]:
+    """Returns the task running in this thread, long running functions can use
+    this to check if they've been cancelled"""
+    return getattr(_local, "task", None)
+
+
+class Task(QRunnable):
+    def __init__(
+        self,
+        scheduler: TaskScheduler,
+        key: Optional[Hashable],
+        func: Callable,
+        priority: TaskPriority,
+    ) -> None:
+        super().__init__()
+        # The scheduler keeps track of these, don't let Qt delete them
+        self.setAutoDelete(False)
+
+        self.key = key
+        self.func = func
+        self.priority = priority
+        self.started = False
+
+        self._scheduler = scheduler
+        self._rerun = False
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    def __repr__(self) -> str:
+        return f"<Task key={self.key} func={self.func} priority={self.priority.name}>"
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the task to finish, returns False if it timed out"""
+        return self._done.wait(timeout)
+
+    def run(self):
+        self.started = True
+        _local.task = self
+
+        try:
+            # Requeued while running, run again so nothing is missed
+            while not self.cancelled:
+                # Requeueing can swap in newer arguments, use whatever's newest
+                func = self.func
+                try:
+                    func()
+                except Exception as e:
+                    logger.error(
+                        f"Exception in task {self}",
+                        exc_info=(type(e), e, e.__traceback__),
+                    )
+
+                    traceback.print_exc()
+
+                if not self._scheduler._should_rerun(self):
+                    break
+        finally:
+            _local.task = None
+            self._scheduler._finished(self)
+
+
+class TaskScheduler:
+    """Runs functions on a bounded thread pool. Tasks submitted with a key are
+    coalesced, if a task with the same key is still waiting or running that
+    one is returned instead of starting the same work again"""
+
+    def __init__(self, pool: QThreadPool) -> None:
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._tasks: Dict[Hashable, Task] = {}
+        # Qt doesn't hold a reference to these, keep them alive until they're done
+        self._alive: Set[Task] = set()
+
+    def submit(
+        self,
+        func: Callable,
+        *args: Any,
+        key: Optional[Hashable] = None,
+        priority: TaskPriority = TaskPriority.NORMAL,
+        requeue: bool = False,
+        replace: bool = False,
+        **kwargs: Any,
+    ) -> Task:
+        """Submits a function to be run. If a task with this key already exists
+        it is returned, unless replace is set in which case it's cancelled and
+        this one is started instead. Requeue will make an already running task
+        run once more after it finishes, for when the work it started with may
+        be out of date. The existing task runs with these arguments from then
+        on, so the newest ones are never dropped"""
+        func = functools.partial(func, *args, **kwargs)
+
+        with self._lock:
+            existing = self._tasks.get(key) if key is not None else None
+
+            if existing is not None and not existing.cancelled:
+                if replace:
+                    self._cancel(existing)
+                else:
+                    if requeue:
+                        existing.func = func
+                        if existing.started:
+                            existing._rerun = True
+                    return existing
+
+            task = Task(self, key, func, priority)
+            if key is not None:
+                self._tasks[key] = task
+            self._alive.add(task)
+
+        self._pool.start(task, int(priority))
+        return task
+
+    def get(self, key: Hashable) -> Optional[Task]:
+        with self._lock:
+            return self._tasks.get(key)
+
+    def cancel(self, key: Hashable):
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None:
+                self._cancel(task)
+
+    def wait(self, key: Hashable, timeout: Optional[float] = None) -> bool:
+        """Waits on the task with this key, if there is one"""
+        task = self.get(key)
+        return task.wait(timeout) if task is not None else True
+
+    def shutdown(self, timeout: int = 1000):
+        with self._lock:
+            for task in list(self._tasks.values()):
+                self._cancel(task)
+
+        self._pool.waitForDone(timeout)
+
+    def _cancel(self, task: Task):
+        task.cancel()
+        self._tasks.pop(task.key, None)
+
+        # If it hasn't started yet, just take it off the queue entirely
+        if self._pool.tryTake(task):
+            self._alive.discard(task)
+            task._done.set()
+
+    def _should_rerun(self, task: Task) -> bool:
+        """Whether a task was requeued while it ran. If it wasn't it's taken off
+        the keyed tasks here, under the same lock submit requeues with, so a
+        requeue either makes it run again or starts a new task"""
+        with self._lock:
+            if task._rerun and not task.cancelled:
+                task._rerun = False
+                return True
+
+            if self._tasks.get(task.key) is task:
+                del self._tasks[task.key]
+            return False
+
+    def _finished(self, task: Task):
+        with self._lock:
+            if self._tasks.get(task.key) is task:
+                del self._tasks[task.key]
+            self._alive.discard(task)
+
+        task._done.set()
+
+
+def download_helper(url: str, status: Optional[StatusHelper] = None) -> Iterator[str]:
     # Open tmp file, don't delete after
     with tempfile.NamedTemporaryFile(delete=False) as f:
         # Stream request to get update of download progress
@@ -73,6 +276,8 @@ def download_helper(url: str) -> Iterator[str]:
                 total_downloaded += len(block)
 
                 f.write(block)
+                if status is not None and total_size:
+                    status.progress = total_downloaded / total_size
 
                 yield f"Downloaded {total_downloaded/1000000:.2f}/{total_size/1000000:.2f} MB"
 
@@ -132,8 +337,9 @@ def try_update(window: MainWindow):
             url = "https://github.com/Phxntxm/AniTracker/releases/latest/download/AniTrackerSetup.exe"
 
         # Update status for each update in the download streamer
-        for update in download_helper(url):
+        for update in download_helper(url, status):
             status.status = update
+        status.progress = None
     else:
         status.status = "Already up to date!"
         sleep(2)
@@ -165,9 +371,12 @@ def refresh_folder(window: MainWindow, *, loop_forever=False):
     while True:
         status = StatusHelper("Checking anime folder...")
         window.statuses.append(status)
-        window.app._refresh_anime_folder()
+        diff = window.app._refresh_anime_folder()
         window.statuses.remove(status)
-        window.reload_anime_eps.emit()  # type: ignore
+        # Only bother the tables if something actually changed
+        if diff:
+            window.reload_anime_eps.emit()  # type: ignore
+            window.app.prefetch_thumbnails()
 
         # Simply break if we're not meant to loop forever
         if not loop_forever:
@@ -176,6 +385,70 @@ def refresh_folder(window: MainWindow, *, loop_forever=False):
         sleep(120)
 
 
+def _anime_folder(window: MainWindow) -> Optional[str]:
+    try:
+        return str(Path(window.app._config["animedir"]).expanduser())
+    except (KeyError, TypeError):
+        return None
+
+
+def watch_folder(window: MainWindow):
+    """Watches the anime folder for changes, and rescans only the directories
+    that changed. Falls back to polling if inotify can't be used"""
+    while True:
+        root = _anime_folder(window)
+
+        # Nothing to watch yet, wait until it's been set
+        if root is None:
+            sleep(2)
+            continue
+
+        try:
+            watcher = InotifyWatcher(root)
+        except OSError as e:
+            logger.info(f"Could not watch anime folder, falling back to polling: {e}")
+            refresh_folder(window, loop_forever=True)
+            return
+
+        # The watches are setup, now load what's already there
+        refresh_folder(window)
+
+        try:
+            # Start over if the anime folder is changed
+            while _anime_folder(window) == root:
+                changed = watcher.read(2)
+                if not changed:
+                    continue
+
+                # Things like a torrent client writing a whole season at once come
+                # in bursts, wait for it to quiet down so it's all one update
+                deadline = monotonic() + 10
+                while monotonic() < deadline and (more := watcher.read(1)):
+                    changed |= more
+
+                _refresh_changed(window, changed)
+        except OSError as e:
+            # Most likely out of watches for a new directory, the rest of the
+            # tree would go unwatched so poll everything instead
+            logger.info(f"Stopped watching anime folder, falling back to polling: {e}")
+            watcher.close()
+            refresh_folder(window, loop_forever=True)
+            return
+        finally:
+            watcher.close()
+
+
+def _refresh_changed(window: MainWindow, changed: Set[str]):
+    status = StatusHelper("Checking anime folder...")
+    window.statuses.append(status)
+    diff = window.app._refresh_anime_folder(changed)
+    window.statuses.remove(status)
+
+    if diff:
+        window.reload_anime_eps.emit()  # type: ignore
+        window.app.prefetch_thumbnails()
+
+
 def connect_to_anilist(window: MainWindow):
     status = StatusHelper("Connecting to anilist...")
     window.statuses.append(status)
@@ -187,65 +460,302 @@ def connect_to_anilist(window: MainWindow):
             f"Connected account: {window.app._anilist.name}"
         )
         # If we authenticated at all, refresh animes
-        window.anime_updater.start()
+        window.refresh_anilist()
 
     window.statuses.remove(status)
 
 
-def update_from_anilist(window: MainWindow):
+def update_from_anilist(window: MainWindow, full: bool = True):
+    # There's a token before the account is verified, but the lists can't be
+    # fetched without knowing whose they are. Connecting does a full sync once
+    # it's verified, so nothing is missed by skipping until then
+    if window.app._anilist.id is None:
+        return
+
     # Load the anilist tables
     if window.app._anilist.authenticated:
         status = StatusHelper("Refreshing data from anilist...")
         window.statuses.append(status)
         # First refresh from anilist
-        window.app.refresh_from_anilist()
+        window.app.refresh_from_anilist(full=full)
         window.handle_anime_updates.emit()  # type: ignore
         window.statuses.remove(status)
+        window.app.prefetch_thumbnails()
 
 
-def status_label(window: MainWindow):
-    while True:
-        window.update_label.emit()  # type: ignore
-        sleep(0.1)
+def fetch_full_anime(window: MainWindow, anime: Anime):
+    status = StatusHelper("Loading anime info")
+    window.statuses.append(status)
+
+    try:
+        anime = window.app.get_full_anime(anime)
+    except requests.RequestException as e:
+        # Show what the search had rather than nothing
+        logger.warning(f"Could not fetch {anime.id} from anilist: {e}")
+    finally:
+        window.statuses.remove(status)
+
+    window.anime_info_ready.emit(anime)  # type: ignore
 
 
 def edit_anime(window: MainWindow, anime: Union[Anime, AnimeCollection], **kwargs):
     status = StatusHelper("Updating anime lists")
     window.statuses.append(status)
-    anime.edit(window.app._anilist, **kwargs)
+    window.app.edit_anime(anime, **kwargs)
     window.statuses.remove(status)
 
+    if isinstance(anime, AnimeCollection):
+        window.anime_updated.emit(anime)  # type: ignore
+
+
+def sync_mutations(window: MainWindow):
+    """Sends queued list edits to anilist as they come in. If anilist can't be
+    reached they're retried, waiting longer each time"""
+    queue = window.app._mutations
+    failures = 0
+    delay: Optional[float] = None
+
+    while True:
+        # A new edit always gets sent straight away
+        if queue.wait(delay):
+            # Edits usually come in bursts, this lets them all be sent together
+            sleep(0.5)
+
+        if not len(queue):
+            delay = None
+            continue
+        if not window.app._anilist.authenticated:
+            delay = 5
+            continue
+
+        status = StatusHelper("Sending changes to anilist")
+        window.statuses.append(status)
+
+        try:
+            emptied, added = window.app.flush_mutations()
+        except Exception as e:
+            logger.error(
+                "Could not send changes to anilist",
+                exc_info=(type(e), e, e.__traceback__),
+            )
+            emptied, added = False, False
+        finally:
+            window.statuses.remove(status)
+
+        # Anything new only shows up once it's been synced
+        if added:
+            window.refresh_anilist(full=False)
+
+        failures = 0 if emptied else failures + 1
+        delay = None if emptied else min(300, 5 * 2 ** failures)
+
 
 def search_nyaa(window: MainWindow, query: str):
     status = StatusHelper("Searching nyaa.si")
     window.statuses.append(status)
     results = list(window.app.search_nyaa(query))
-    window.nyaa_results.emit(results)  # type: ignore
+
+    # Only show the results if a newer search wasn't started
+    task = current_task()
+    if task is None or not task.cancelled:
+        window.nyaa_results.emit(results)  # type: ignore
     window.statuses.remove(status)
 
 
-def search_anilist(window: MainWindow, query: str):
+async def _search_anilist(window: MainWindow, query: str, attributes: List[str]):
+    task = current_task()
+    # Only what the table shows is fetched, the info panel gets the rest itself
+    results = AsyncAniList(window.app._anilist).search_anime(query, attributes)
+
+    try:
+        # Rows are added as each page comes in, instead of after the last one
+        async for result in results:
+            # A newer search was started, don't mix the results
+            if task is not None and task.cancelled:
+                break
+
+            window.insert_row_signal.emit(window.ui.AnilistSearchResults, result)  # type: ignore
+    finally:
+        await results.aclose()
+
+
+def search_anilist(window: MainWindow, query: str, attributes: List[str]):
     status = StatusHelper("Searching anilist")
     window.statuses.append(status)
-    results = window.app._anilist.search_anime(query)
 
-    for result in results:
-        window.insert_row_signal.emit(window.ui.AnilistSearchResults, result)  # type: ignore
-    window.statuses.remove(status)
+    try:
+        asyncio.run(_search_anilist(window, query, attributes))
+    finally:
+        window.statuses.remove(status)
 
 
 def generate_thumbnails(
     window: MainWindow, episodes: List[AnimeFile], anime: AnimeCollection
-):
+) -> List[Future]:
+    """Starts generating thumbnails for the episodes, in the order given. Each one
+    is sent to the episode list as soon as it's ready, the futures returned can
+    be cancelled to stop any that haven't started yet"""
+    futures = []
+
     for ep in episodes:
-        # The property handles caching thumbnails, just access to trigger it
-        ep.thumbnail
+        future = window.app._thumbnails.submit(ep)
+        future.add_done_callback(functools.partial(_thumbnail_done, window, ep, anime))
+        futures.append(future)
 
-    # Once we're done emit the update to add to scroll area
-    window.add_episodes_to_widget.emit(episodes, anime)  # type: ignore
+    return futures
+
+
+def _thumbnail_done(
+    window: MainWindow, episode: AnimeFile, anime: AnimeCollection, future: Future
+):
+    if future.cancelled():
+        return
+
+    try:
+        thumbnail = future.result()
+    except Exception as e:
+        logger.error(
+            "Could not generate thumbnail", exc_info=(type(e), e, e.__traceback__)
+        )
+    else:
+        window.episode_thumbnail_ready.emit(episode, anime, thumbnail)  # type: ignore
+
+
+class AniListQueueStatus:
+    """Shows how many anilist requests are waiting on the rate limit"""
+
+    def __init__(self, window: MainWindow) -> None:
+        self._window = window
+        self._lock = threading.Lock()
+        self._status: Optional[StatusHelper] = None
+
+    def __call__(self, depth: int):
+        with self._lock:
+            if depth and self._status is None:
+                self._status = StatusHelper("", "rgb(255, 200, 36);")
+                self._window.statuses.append(self._status)
+            elif not depth and self._status is not None:
+                self._window.statuses.remove(self._status)
+                self._status = None
+
+            if self._status is not None:
+                self._status.status = (
+                    f"Waiting on anilist rate limit ({depth} queued)"
+                )
 
 
 class StatusHelper:
-    def __init__(self, status: str, color: Optional[str] = "rgb(36, 255, 36);") -> None:
-        self.status = status
+    """A status shown in the status bar while it's in the window's statuses,
+    changing it while it's there updates the status bar"""
+
+    def __init__(
+        self,
+        status: str,
+        color: Optional[str] = "rgb(36, 255, 36);",
+        progress: Optional[float] = None,
+    ) -> None:
+        self._registry: Optional[StatusRegistry] = None
+        self._status = status
+        self._progress = progress
         self.color = color
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, status: str):
+        self._status = status
+        self._changed()
+
+    @property
+    def progress(self) -> Optional[float]:
+        """How far along this is from 0 to 1, if that's known"""
+        return self._progress
+
+    @progress.setter
+    def progress(self, progress: Optional[float]):
+        self._progress = progress
+        self._changed()
+
+    @property
+    def text(self) -> str:
+        if self._progress is None:
+            return self._status
+
+        return f"{self._status} ({self._progress:.0%})"
+
+    def _changed(self):
+        registry = self._registry
+        if registry is not None:
+            registry._changed()
+
+
+class StatusRegistry(QObject):
+    """The statuses shown in the status bar, the oldest one is what's shown.
+    These can be added, changed and removed from any thread. The status bar is
+    only told something changed when it did, and no more than once per interval"""
+
+    changed = Signal()
+    _schedule = Signal()
+
+    def __init__(
+        self, parent: Optional[QObject] = None, *, interval: int = 100
+    ) -> None:
+        super().__init__(parent)
+
+        self._lock = threading.Lock()
+        self._statuses: List[StatusHelper] = []
+        # Set until the status bar has been told, so a burst of changes
+        # only has to cross over to the UI thread once
+        self._pending = False
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._flush)  # type: ignore
+        # The timer can only be started from the UI thread
+        self._schedule.connect(self._start, Qt.QueuedConnection)  # type: ignore
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._statuses)
+
+    def append(self, status: StatusHelper):
+        with self._lock:
+            self._statuses.append(status)
+            status._registry = self
+
+        self._changed()
+
+    def remove(self, status: StatusHelper):
+        with self._lock:
+            try:
+                self._statuses.remove(status)
+            except ValueError:
+                return
+            status._registry = None
+
+        self._changed()
+
+    def current(self) -> Optional[StatusHelper]:
+        with self._lock:
+            return self._statuses[0] if self._statuses else None
+
+    def _changed(self):
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+
+        self._schedule.emit()  # type: ignore
+
+    def _start(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            self._pending = False
+
+        self.changed.emit()  # type: ignore
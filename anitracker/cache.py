@@ -0,0 +1,477 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import aniparser
+
+from anitracker import logger
+from anitracker.media.anime import extract_thumbnail
+
+if TYPE_CHECKING:
+    from anitracker.media import AnimeFile
+
+__all__ = ("ListStore", "MediaCache", "MetadataCache", "ThumbnailCache")
+
+# Bump this whenever what gets stored changes, everything cached will be dropped
+CACHE_VERSION = 1
+MEDIA_CACHE_VERSION = 1
+LIST_STORE_VERSION = 1
+
+# How long media data is trusted for, by the media's status. Anything still
+# airing changes every week, anything finished hardly ever does
+DAY = 24 * 60 * 60
+MEDIA_TTL = {
+    "FINISHED": 30 * DAY,
+    "CANCELLED": 30 * DAY,
+    "HIATUS": 7 * DAY,
+    "RELEASING": DAY,
+    "NOT_YET_RELEASED": DAY,
+}
+
+
+class MetadataCache:
+    """A persistent cache of what files were parsed into, and of what ffprobe
+    returned for them. Entries are keyed by the path, and are only used if the
+    size and mtime of the file still match"""
+
+    def __init__(self, path: Path, *, max_entries: int = 100000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._accessed: Set[str] = set()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._setup()
+
+    def _setup(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        parser_version = getattr(aniparser, "__version__", "")
+
+        # Anything cached by a different version of the parser may not be right anymore
+        if version == CACHE_VERSION:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'parser_version'"
+            ).fetchone()
+            if row is None or row[0] != parser_version:
+                version = 0
+
+        if version != CACHE_VERSION:
+            logger.info(f"Resetting metadata cache at {self.path}")
+            self._conn.execute("DROP TABLE IF EXISTS files")
+            self._conn.execute("DROP TABLE IF EXISTS meta")
+
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                parsed TEXT,
+                probe TEXT,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('parser_version', ?)",
+            (parser_version,),
+        )
+        self._conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+
+    def _get(self, column: str, path: str, size: int, mtime: int) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {column} FROM files WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime),
+            ).fetchone()
+
+            if row is None or row[0] is None:
+                return None
+
+            # Writing on every read is slow, these are written in flush
+            self._accessed.add(path)
+
+        return json.loads(row[0])
+
+    def _set(self, column: str, path: str, size: int, mtime: int, value: Any):
+        self._set_many(column, [(path, size, mtime, value)])
+
+    def _set_many(self, column: str, entries: Iterable[Tuple[str, int, int, Any]]):
+        # All in one transaction, committing each one is an fsync per file
+        now = time.time()
+        rows = [
+            (path, size, mtime, json.dumps(value, default=str))
+            for path, size, mtime, value in entries
+        ]
+
+        with self._lock, self._conn:
+            # If the file changed, anything else stored for it is out of date
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ? AND (size != ? OR mtime != ?)",
+                ((path, size, mtime) for path, size, mtime, _ in rows),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO files (path, size, mtime, accessed) VALUES (?, ?, ?, ?)",
+                ((path, size, mtime, now) for path, size, mtime, _ in rows),
+            )
+            self._conn.executemany(
+                f"UPDATE files SET {column} = ?, accessed = ? WHERE path = ?",
+                ((data, now, path) for path, _, _, data in rows),
+            )
+
+    def get_parsed(self, path: str, size: int, mtime: int) -> Optional[Dict]:
+        return self._get("parsed", path, size, mtime)
+
+    def set_parsed(self, path: str, size: int, mtime: int, data: Dict):
+        self._set("parsed", path, size, mtime, data)
+
+    def set_parsed_many(self, entries: Iterable[Tuple[str, int, int, Dict]]):
+        """Stores (path, size, mtime, data) for many files at once"""
+        self._set_many("parsed", entries)
+
+    def get_probe(self, path: str, size: int, mtime: int) -> Optional[Dict]:
+        return self._get("probe", path, size, mtime)
+
+    def set_probe(self, path: str, size: int, mtime: int, data: Dict):
+        self._set("probe", path, size, mtime, data)
+
+    def invalidate(self, path: Optional[str] = None):
+        """Removes the cached data for a path, or everything if no path is given"""
+        with self._lock, self._conn:
+            if path is None:
+                self._conn.execute("DELETE FROM files")
+                self._accessed.clear()
+            else:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                self._accessed.discard(path)
+
+    def flush(self):
+        """Records which entries were used since the last flush, and evicts the
+        least recently used entries if the cache has grown too large"""
+        with self._lock, self._conn:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE files SET accessed = ? WHERE path = ?",
+                ((now, path) for path in self._accessed),
+            )
+            self._accessed.clear()
+
+            count = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM files WHERE path IN "
+                    "(SELECT path FROM files ORDER BY accessed LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                logger.debug(f"Evicted {count - self.max_entries} cached files")
+
+
+class MediaCache:
+    """AniList media data, which rarely changes, kept on disk so list refreshes
+    only have to fetch the list entries themselves"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+
+        with self._lock, self._conn:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+
+            if version != MEDIA_CACHE_VERSION:
+                logger.info(f"Resetting media cache at {self.path}")
+                self._conn.execute("DROP TABLE IF EXISTS media")
+
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS media (
+                    id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(f"PRAGMA user_version = {MEDIA_CACHE_VERSION}")
+
+    def get_many(self, ids: Iterable[int]) -> Tuple[Dict[int, Dict], List[int]]:
+        """Returns everything cached for these ids, and which of the ids are
+        missing or stale and should be fetched again"""
+        ids = list(ids)
+        media: Dict[int, Dict] = {}
+        fresh: Set[int] = set()
+        now = time.time()
+
+        with self._lock:
+            # There's a limit to how many parameters a query can have
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT id, data, expires FROM media WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+
+                for id, data, expires in rows:
+                    media[id] = json.loads(data)
+                    if expires > now:
+                        fresh.add(id)
+
+        return media, [id for id in ids if id not in fresh]
+
+    def set_many(self, media: Iterable[Dict]):
+        now = time.time()
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO media VALUES (?, ?, ?)",
+                (
+                    (m["id"], json.dumps(m), now + MEDIA_TTL.get(m["status"], DAY))
+                    for m in media
+                ),
+            )
+
+
+class ListStore:
+    """A local copy of the user's list entries, without their media, so the
+    lists can be shown at startup before anilist has answered, or at all"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+
+        with self._lock, self._conn:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+
+            if version != LIST_STORE_VERSION:
+                logger.info(f"Resetting list store at {self.path}")
+                self._conn.execute("DROP TABLE IF EXISTS entries")
+                self._conn.execute("DROP TABLE IF EXISTS cursors")
+
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    media_id INTEGER PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cursors (type TEXT PRIMARY KEY, cursor INTEGER)"
+            )
+            self._conn.execute(f"PRAGMA user_version = {LIST_STORE_VERSION}")
+
+    def load(self, _type: str) -> Tuple[List[Dict], int]:
+        """Returns the stored entries of this list type, and its sync cursor"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM entries WHERE type = ?", (_type,)
+            ).fetchall()
+            cursor = self._conn.execute(
+                "SELECT cursor FROM cursors WHERE type = ?", (_type,)
+            ).fetchone()
+
+        return [json.loads(data) for data, in rows], cursor[0] if cursor else 0
+
+    def _rows(self, _type: str, entries: Iterable[Dict]):
+        for entry in entries:
+            data = {key: value for key, value in entry.items() if key != "media"}
+            yield entry["mediaId"], _type, json.dumps(data)
+
+    def replace(self, _type: str, entries: Iterable[Dict], cursor: int):
+        """Replaces everything stored for this list type"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE type = ?", (_type,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                self._rows(_type, entries),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cursors VALUES (?, ?)", (_type, cursor)
+            )
+
+    def update(self, _type: str, entries: Iterable[Dict], cursor: Optional[int] = None):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                self._rows(_type, entries),
+            )
+            if cursor is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cursors VALUES (?, ?)", (_type, cursor)
+                )
+
+    def remove(self, media_id: int):
+        self.remove_many([media_id])
+
+    def remove_many(self, media_ids: Iterable[int]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM entries WHERE media_id = ?", ((i,) for i in media_ids)
+            )
+
+
+class ThumbnailCache:
+    """Episode thumbnails stored on disk. Each one is named after a hash of the
+    file's path, size and mtime, so a changed file just gets a new thumbnail.
+    Missing ones are generated in a bounded pool of ffmpeg workers"""
+
+    def __init__(
+        self, directory: Path, *, workers: int = 4, max_entries: int = 10000
+    ) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+
+        if not self.directory.exists():
+            self.directory.mkdir(parents=True)
+
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._futures: Dict[str, Future[bytes]] = {}
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="thumbnail")
+        # Prefetching only happens one at a time, and only while nothing else is
+        self._idle_executor = ThreadPoolExecutor(1, thread_name_prefix="prefetch")
+        self._prefetches: Dict[str, Future[None]] = {}
+
+    def close(self):
+        """Drops everything that's still queued. The executors' threads are
+        joined when the interpreter exits, so anything left would keep the
+        process alive until it was all generated"""
+        self._closed.set()
+
+        with self._lock:
+            futures = list(self._futures.values()) + list(self._prefetches.values())
+
+        for future in futures:
+            future.cancel()
+
+        self._executor.shutdown(wait=False)
+        self._idle_executor.shutdown(wait=False)
+
+    def _path(self, file: str) -> Optional[Path]:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+
+        key = f"{file}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()
+        return self.directory / f"{hashlib.sha1(key).hexdigest()}.jpg"
+
+    def _generate(self, episode: AnimeFile) -> bytes:
+        path = self._path(episode.file)
+
+        if path is not None and path.exists():
+            image = path.read_bytes()
+        else:
+            image = extract_thumbnail(episode.file)
+
+            # Write it somewhere else first, so a half written one is never read
+            if path is not None and image:
+                with tempfile.NamedTemporaryFile(
+                    dir=self.directory, suffix=".tmp", delete=False
+                ) as f:
+                    f.write(image)
+                os.replace(f.name, path)
+
+        episode._thumbnail = image
+        return image
+
+    def submit(self, episode: AnimeFile) -> Future[bytes]:
+        """Returns a future for the episode's thumbnail, it's generated if it
+        isn't already in memory or on disk. Requests for an episode that's
+        already being generated share the same future"""
+        if episode._thumbnail is not None:
+            future: Future[bytes] = Future()
+            future.set_result(episode._thumbnail)
+            return future
+
+        with self._lock:
+            future = self._futures.get(episode.file)
+
+            if future is None:
+                future = self._executor.submit(self._generate, episode)
+                self._futures[episode.file] = future
+                future.add_done_callback(
+                    lambda _, file=episode.file: self._futures.pop(file, None)
+                )
+
+        return future
+
+    def _busy(self) -> bool:
+        with self._lock:
+            return bool(self._futures)
+
+    def _prefetch(self, episode: AnimeFile):
+        if self._closed.is_set():
+            return
+
+        path = self._path(episode.file)
+        if episode._thumbnail is not None or path is None or path.exists():
+            return
+
+        # Anything the user actually clicked on comes first
+        while self._busy():
+            if self._closed.is_set():
+                return
+            time.sleep(0.5)
+
+        try:
+            self._generate(episode)
+        except Exception as e:
+            logger.error(
+                f"Could not prefetch thumbnail for {episode}",
+                exc_info=(type(e), e, e.__traceback__),
+            )
+
+    def prefetch(self, episodes: Iterable[AnimeFile]):
+        """Queues thumbnails to be generated in the background, when nothing
+        else is being generated. Episodes that are already queued are skipped"""
+        if self._closed.is_set():
+            return
+
+        with self._lock:
+            for episode in episodes:
+                if episode.file in self._prefetches:
+                    continue
+
+                future = self._idle_executor.submit(self._prefetch, episode)
+                self._prefetches[episode.file] = future
+                future.add_done_callback(
+                    lambda _, file=episode.file: self._prefetches.pop(file, None)
+                )
+
+        self._idle_executor.submit(self.prune)
+
+    def prune(self):
+        """Removes the least recently written thumbnails past max_entries"""
+        if self._closed.is_set():
+            return
+
+        files = sorted(
+            self.directory.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True
+        )
+
+        for path in files[self.max_entries :]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -11,7 +11,20 @@ if frozen_path is not None:
 else:
     CONFIG_LOCATION = pathlib.Path("~/.config/anitracker/")
 
-DEFAULT_SETTINGS = {"subtitle": "eng", "skip_songs_signs": True}
+DEFAULT_SETTINGS = {
+    "subtitle": "eng",
+    "skip_songs_signs": True,
+    "match_workers": -1,
+    "scan_workers": 0,
+    "ignore_patterns": ["@eaDir", ".*", "sample", "samples", "*.sample.*", "*-sample.*"],
+    "cache_max_entries": 100000,
+    "thumbnail_workers": 4,
+    "thumbnail_prefetch": True,
+    "anilist_pool_size": 10,
+    "anilist_timeout": 30,
+    "filter_delay": 150,
+    "filter_fuzzy": False,
+}
 VALUE_TYPE = Any
 
 
@@ -31,8 +44,12 @@ class Config:
         except FileNotFoundError:
             self.__config = {}
 
-        if "Default" not in self.__config:
-            self.__config["Default"] = DEFAULT_SETTINGS
+        # The defaults get saved along with everything else, make sure any
+        # defaults added since then are there too
+        self.__config["Default"] = {
+            **self.__config.get("Default", {}),
+            **DEFAULT_SETTINGS,
+        }
         if "User" not in self.__config:
             self.__config["User"] = {}
 
@@ -1 +1,2 @@
 from . import queries
+from .registry import QueryRegistry
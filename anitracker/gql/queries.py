@@ -1,3 +1,43 @@
+# Everything we use from a media, MEDIA_FIELDS in a query is replaced with this,
+# or with only the fields that are needed
+media_fields = """
+id
+season
+seasonYear
+genres
+coverImage {
+  large
+}
+tags {
+  name
+  rank
+  isMediaSpoiler
+}
+studios {
+  edges {
+    node {
+      name
+      isAnimationStudio
+    }
+  }
+}
+title {
+  romaji
+  english
+  native
+  userPreferred
+}
+format
+status
+description
+startDate {year month day}
+endDate {year month day}
+episodes
+chapters
+volumes
+averageScore
+"""
+
 media_collection = """
 query ($userName: String, $type: MediaType) {
   MediaListCollection (userName: $userName, type: $type) {
@@ -13,49 +53,47 @@ query ($userName: String, $type: MediaType) {
         updatedAt
         startedAt {year month day}
         completedAt {year month day}
-        media {
-          id
-          season
-          seasonYear
-          genres
-          coverImage {
-            large
-          }
-          tags {
-            name
-            rank
-            isMediaSpoiler
-          }
-          studios {
-            edges {
-              node {
-                name
-                isAnimationStudio
-              }
-            }
-          }
-          title {
-            romaji
-            english
-            native
-            userPreferred
-          }
-          format
-          status
-          description
-          startDate {year month day}
-          endDate {year month day}
-          episodes
-          chapters
-          volumes
-          averageScore
-        }
       }
     }
   }
 }
 """
 
+media_list_updates = """
+query ($userId: Int, $type: MediaType, $page: Int) {
+  Page (page: $page, perPage: 50) {
+    pageInfo {
+      hasNextPage
+    }
+    mediaList (userId: $userId, type: $type, sort: UPDATED_TIME_DESC) {
+      id
+      mediaId
+      status
+      score
+      notes
+      progress
+      repeat
+      updatedAt
+      startedAt {year month day}
+      completedAt {year month day}
+    }
+  }
+}
+"""
+
+media_by_ids = """
+query ($ids: [Int], $page: Int) {
+  Page (page: $page, perPage: 50) {
+    pageInfo {
+      hasNextPage
+    }
+    media (id_in: $ids) {
+      MEDIA_FIELDS
+    }
+  }
+}
+"""
+
 update_entry = """
 mutation (
   $id: Int,
@@ -82,6 +120,7 @@ mutation (
   )
   {
     id
+    mediaId
     status
     score
     notes
@@ -122,43 +161,10 @@ query($page:Int,$search:String) {
     pageInfo {
       currentPage
       hasNextPage
+      lastPage
     }
     media(search:$search) {
-      id
-      season
-      seasonYear
-      coverImage {
-        large
-      }
-      genres
-      tags {
-        name
-        rank
-        isMediaSpoiler
-      }
-      studios {
-        edges {
-          node {
-            name
-            isAnimationStudio
-          }
-        }
-      }
-      title {
-        romaji
-        english
-        native
-        userPreferred
-      }
-      format
-      status
-      chapters
-      volumes
-      description
-      startDate {year month day}
-      endDate {year month day}
-      episodes
-      averageScore
+      MEDIA_FIELDS
     }
   }
 }
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from . import queries
+
+__all__ = ("QueryRegistry",)
+
+# What has to be selected for each attribute of a media, these are the same
+# names the table headers use. The id, titles and cover are always selected
+MEDIA_ATTRIBUTE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "status": ("status",),
+    "anime_status": ("status",),
+    "description": ("description",),
+    "start_date": ("startDate {year month day}",),
+    "anime_start_date": ("startDate {year month day}",),
+    "end_date": ("endDate {year month day}",),
+    "anime_end_date": ("endDate {year month day}",),
+    "episode_count": ("episodes",),
+    "chapters": ("chapters",),
+    "volumes": ("volumes",),
+    "average_score": ("averageScore",),
+    "season": ("season", "seasonYear"),
+    "genres": ("genres",),
+    "tags": ("tags { name rank isMediaSpoiler }",),
+    "studio": ("studios { edges { node { name isAnimationStudio } } }",),
+}
+# Always needed, whatever is shown. The format filters out manga in searches, the
+# titles are used for matching and searching nyaa, the cover for the info panel
+REQUIRED_MEDIA_FIELDS = (
+    "id",
+    "format",
+    "title { romaji english native userPreferred }",
+    "coverImage { large }",
+)
+
+
+class QueryRegistry:
+    """Every query the client sends. Queries that select media can be built with
+    only the fields for the attributes that are needed, every query built is
+    kept so it's only built once"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._queries: Dict[Tuple[str, Optional[FrozenSet[str]]], str] = {}
+
+    @staticmethod
+    def media_selection(attributes: Optional[Iterable[str]] = None) -> str:
+        """The media fields needed for these attributes, or all of them"""
+        if attributes is None:
+            return queries.media_fields
+
+        fields = dict.fromkeys(REQUIRED_MEDIA_FIELDS)
+        for attribute in attributes:
+            fields.update(dict.fromkeys(MEDIA_ATTRIBUTE_FIELDS.get(attribute, ())))
+
+        return "\n".join(fields)
+
+    def get(self, name: str, attributes: Optional[Iterable[str]] = None) -> str:
+        key = (name, frozenset(attributes) if attributes is not None else None)
+
+        with self._lock:
+            query = self._queries.get(key)
+
+            if query is None:
+                query = getattr(queries, name).replace(
+                    "MEDIA_FIELDS", self.media_selection(key[1])
+                )
+                self._queries[key] = query
+
+        return query
@@ -0,0 +1,524 @@
+from __future__ import annotations
+
+import fnmatch
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from aniparser import parse
+
+from anitracker import logger
+from anitracker.media import AnimeFile
+
+if TYPE_CHECKING:
+    from anitracker.cache import MetadataCache
+
+__all__ = (
+    "FileSnapshot",
+    "ParsedFile",
+    "LibraryDiff",
+    "LibraryScanner",
+    "parse_file",
+)
+
+video_file_extensions = frozenset(
+    {
+        "webm",
+        "mkv",
+        "flv",
+        "vob",
+        "ogv",
+        "ogg",
+        "drc",
+        "gif",
+        "gifv",
+        "mng",
+        "avi",
+        "mts",
+        "m2ts",
+        "ts",
+        "mov",
+        "qt",
+        "wmv",
+        "yuv",
+        "rm",
+        "rmvb",
+        "viv",
+        "asf",
+        "amv",
+        "mp4",
+        "m4p",
+        "m4v",
+        "mpg",
+        "mp2",
+        "mpeg",
+        "mpe",
+        "mpv",
+        "m2v",
+        "svi",
+        "3gp",
+        "3g2",
+        "mxf",
+        "roq",
+        "nsv",
+        "f4v",
+        "f4p",
+        "f4a",
+        "f4b",
+    }
+)
+subtitle_file_extensions = frozenset(
+    {"ass", "cmml", "lrc", "sami", "ttml", "srt", "ssa", "usf"}
+)
+# Anything else is never going to be used, so it isn't even parsed
+anime_file_extensions = video_file_extensions | subtitle_file_extensions
+
+# Below this many files to parse, starting up worker processes costs more than it saves
+PARALLEL_PARSE_THRESHOLD = 200
+
+
+@dataclass(frozen=True)
+class FileSnapshot:
+    """What a file or directory looked like the last time it was scanned"""
+
+    size: int
+    mtime: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, stat: os.stat_result) -> FileSnapshot:
+        return cls(stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+@dataclass
+class ParsedFile:
+    """The result of parsing a single file in the library. A video file
+    can contain multiple episodes, a subtitle file will have its key set"""
+
+    snapshot: FileSnapshot
+    episodes: List[AnimeFile] = field(default_factory=list)
+    subtitle: Optional[Tuple[str, int]] = None
+
+
+@dataclass
+class _DirVisit:
+    """What was found when visiting a directory. Files is None if neither the
+    directory nor any of the files already known in it changed"""
+
+    directory: str
+    stat: os.stat_result
+    subdirs: List[str]
+    files: Optional[Dict[str, FileSnapshot]] = None
+
+
+@dataclass
+class LibraryDiff:
+    """The changes found between two scans of the library. Changed files are
+    ones that were already known but whose size, mtime or inode differ, these
+    hold the newly parsed episodes with the old ones being in removed"""
+
+    added: List[AnimeFile] = field(default_factory=list)
+    removed: List[AnimeFile] = field(default_factory=list)
+    changed: List[AnimeFile] = field(default_factory=list)
+    subtitles_changed: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.added or self.removed or self.changed or self.subtitles_changed
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<LibraryDiff added={len(self.added)} removed={len(self.removed)} "
+            f"changed={len(self.changed)}>"
+        )
+
+
+def parse_file(
+    file: Path, snapshot: FileSnapshot, cache: Optional[MetadataCache] = None
+) -> Optional[ParsedFile]:
+    data = None
+    if cache is not None:
+        data = cache.get_parsed(str(file), snapshot.size, snapshot.mtime)
+    if data is None:
+        data = parse(file)
+        if cache is not None:
+            cache.set_parsed(str(file), snapshot.size, snapshot.mtime, data)
+
+    return _parsed_from_data(data, snapshot)
+
+
+def _parse_paths(paths: List[str]) -> List[Dict]:
+    # This runs in the worker processes, it has to stay a top level function
+    return [parse(Path(path)) for path in paths]
+
+
+def _parsed_from_data(data: Dict, snapshot: FileSnapshot) -> Optional[ParsedFile]:
+    # Skip if it doesn't match the format for anime
+    if not data["is_anime"]:
+        return None
+    # Assume it's a movie
+    if "episode" not in data:
+        data["episode"] = "1"
+
+    parsed = ParsedFile(snapshot)
+
+    # If it's a video file just store it
+    if data.get("extension", "").lower() in video_file_extensions:
+        result = AnimeFile.from_data(data)
+        if isinstance(result, list):
+            parsed.episodes.extend(result)
+        elif isinstance(result, AnimeFile):
+            parsed.episodes.append(result)
+    # Otherwise if it's a subtitle track, store it
+    if data.get("extension", "").lower() in subtitle_file_extensions:
+        parsed.subtitle = (data["anime_title"], int(data["episode"]))
+
+    return parsed
+
+
+def _is_within(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class LibraryScanner:
+    """Keeps a snapshot of every file and directory under the root, so that
+    rescans only have to list directories that changed and only have to parse
+    files that were added or modified
+
+    Directories are walked concurrently, and if there are enough files to parse
+    (such as the first scan of a library) they're parsed in worker processes
+
+    Files and directories matching any of the ignore globs, and files that aren't
+    video or subtitle files, are skipped without being looked at"""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        cache: Optional[MetadataCache] = None,
+        workers: int = 0,
+        ignore: Sequence[str] = (),
+    ) -> None:
+        self.root = root
+        self.cache = cache
+        # Globs are matched case insensitively against the name only
+        self._ignore: Optional[Pattern[str]] = (
+            re.compile("|".join(fnmatch.translate(glob.lower()) for glob in ignore))
+            if ignore
+            else None
+        )
+        # 0 means use every core, 1 means do everything in this thread
+        self.workers = workers or os.cpu_count() or 1
+        # Directory -> its snapshot and the subdirectories in it
+        self._dirs: Dict[str, Tuple[FileSnapshot, List[str]]] = {}
+        # Directory -> the files directly in it
+        self._dir_files: Dict[str, Dict[str, FileSnapshot]] = {}
+        # File -> what it was parsed into, None if it's not an anime file
+        self._parsed: Dict[str, Optional[ParsedFile]] = {}
+
+        self._episodes: List[AnimeFile] = []
+        self._subtitles: Dict[Tuple[str, int], str] = {}
+
+    @property
+    def episodes(self) -> List[AnimeFile]:
+        return self._episodes
+
+    @property
+    def subtitles(self) -> Dict[Tuple[str, int], str]:
+        return self._subtitles
+
+    def scan(self, directories: Optional[Iterable[str]] = None) -> LibraryDiff:
+        """Scans the library for changes. If directories are provided only those
+        are looked at, they're always listed again even if their mtime didn't
+        change since that's how modified files in them are found"""
+        diff = LibraryDiff()
+
+        if directories is None:
+            roots = [str(self.root)]
+            forced: Set[str] = set()
+        else:
+            roots = sorted(d for d in set(directories) if not self._is_ignored_dir(d))
+            forced = set(roots)
+
+        # Files that need to be parsed, and whether they're new
+        pending: Dict[str, Tuple[FileSnapshot, bool]] = {}
+        seen = self._walk(roots, forced, pending, diff)
+
+        # Anything under what was scanned that wasn't seen this time was removed
+        for directory in [
+            d
+            for d in self._dirs
+            if d not in seen and any(_is_within(d, root) for root in roots)
+        ]:
+            del self._dirs[directory]
+            for name in self._dir_files.pop(directory, {}):
+                self._forget(os.path.join(directory, name), diff)
+
+        self._dirs.update(seen)
+
+        # Merge in path order, so the result doesn't depend on what finished first
+        results = self._parse_pending(pending)
+        for path in sorted(pending):
+            parsed = results[path]
+            self._parsed[path] = parsed
+
+            if parsed is not None:
+                if pending[path][1]:
+                    diff.added.extend(parsed.episodes)
+                else:
+                    diff.changed.extend(parsed.episodes)
+                if parsed.subtitle is not None:
+                    diff.subtitles_changed = True
+
+        if diff:
+            self._rebuild()
+        if self.cache is not None:
+            self.cache.flush()
+
+        logger.debug(f"Scanned {', '.join(roots)}: {diff}")
+        return diff
+
+    def _walk(
+        self,
+        roots: List[str],
+        forced: Set[str],
+        pending: Dict[str, Tuple[FileSnapshot, bool]],
+        diff: LibraryDiff,
+    ) -> Dict[str, Tuple[FileSnapshot, List[str]]]:
+        seen: Dict[str, Tuple[FileSnapshot, List[str]]] = {}
+        visited: Set[Tuple[int, int]] = set()
+        level = roots
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            # Go a level at a time, every directory in a level is visited concurrently
+            while level:
+                if len(level) > 1 and self.workers > 1:
+                    visits = executor.map(
+                        lambda d: self._visit(d, d in forced), level
+                    )
+                else:
+                    visits = (self._visit(d, d in forced) for d in level)
+
+                next_level: List[str] = []
+
+                for visit in visits:
+                    if visit is None:
+                        continue
+
+                    # Symlinks can create loops, don't walk the same directory twice
+                    key = (visit.stat.st_dev, visit.stat.st_ino)
+                    if key in visited:
+                        continue
+                    visited.add(key)
+
+                    if visit.files is not None:
+                        self._diff_dir(visit.directory, visit.files, pending, diff)
+
+                    seen[visit.directory] = (
+                        FileSnapshot.from_stat(visit.stat),
+                        visit.subdirs,
+                    )
+                    next_level.extend(visit.subdirs)
+
+                level = next_level
+
+        return seen
+
+    def _visit(self, directory: str, forced: bool) -> Optional[_DirVisit]:
+        # This runs in the walking threads, it can't modify anything
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            return None
+
+        known = self._dirs.get(directory)
+
+        # If the directory itself hasn't changed, nothing was added or removed
+        # directly in it. Its subdirectories still need to be checked though
+        if (
+            known is not None
+            and known[0] == FileSnapshot.from_stat(stat)
+            and not forced
+        ):
+            return _DirVisit(directory, stat, known[1], self._restat(directory))
+
+        subdirs: List[str] = []
+        files: Dict[str, FileSnapshot] = {}
+
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            entries = []
+
+        for entry in entries:
+            name = entry.name.lower()
+
+            if self._ignore is not None and self._ignore.match(name):
+                continue
+
+            try:
+                # The type comes from the directory listing, this doesn't stat
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                    continue
+            except OSError:
+                continue
+
+            # Artwork, NFOs and the like, don't bother with them
+            if name.rpartition(".")[2] not in anime_file_extensions:
+                continue
+
+            try:
+                files[entry.name] = FileSnapshot.from_stat(entry.stat())
+            except OSError:
+                continue
+
+        subdirs.sort()
+
+        return _DirVisit(directory, stat, subdirs, files)
+
+    def _restat(self, directory: str) -> Optional[Dict[str, FileSnapshot]]:
+        """Files written in place don't change their directory, so without
+        inotify they'd never be noticed. Stats the files known to be in an
+        unchanged directory, returning them all if any of them changed"""
+        known = self._dir_files.get(directory, {})
+        files: Dict[str, FileSnapshot] = {}
+
+        for name in known:
+            try:
+                files[name] = FileSnapshot.from_stat(
+                    os.stat(os.path.join(directory, name))
+                )
+            except OSError:
+                continue
+
+        return None if files == known else files
+
+    def _is_ignored_dir(self, directory: str) -> bool:
+        if self._ignore is None:
+            return False
+
+        try:
+            parts = Path(directory).relative_to(self.root).parts
+        except ValueError:
+            return False
+
+        return any(self._ignore.match(part.lower()) for part in parts)
+
+    def _diff_dir(
+        self,
+        directory: str,
+        files: Dict[str, FileSnapshot],
+        pending: Dict[str, Tuple[FileSnapshot, bool]],
+        diff: LibraryDiff,
+    ):
+        old_files = self._dir_files.get(directory, {})
+
+        for name, snapshot in files.items():
+            old = old_files.get(name)
+
+            if old == snapshot:
+                continue
+
+            path = os.path.join(directory, name)
+
+            # Either a new file, or something about it changed
+            if old is not None:
+                self._forget(path, diff)
+
+            pending[path] = (snapshot, old is None)
+
+        for name in set(old_files) - set(files):
+            self._forget(os.path.join(directory, name), diff)
+
+        self._dir_files[directory] = files
+
+    def _parse_pending(
+        self, pending: Dict[str, Tuple[FileSnapshot, bool]]
+    ) -> Dict[str, Optional[ParsedFile]]:
+        results: Dict[str, Optional[ParsedFile]] = {}
+        missing: List[str] = []
+
+        for path, (snapshot, _) in pending.items():
+            data = None
+            if self.cache is not None:
+                data = self.cache.get_parsed(path, snapshot.size, snapshot.mtime)
+
+            if data is None:
+                missing.append(path)
+            else:
+                results[path] = _parsed_from_data(data, snapshot)
+
+        if len(missing) >= PARALLEL_PARSE_THRESHOLD and self.workers > 1:
+            parsed = self._parse_parallel(missing)
+        else:
+            parsed = _parse_paths(missing)
+
+        for path, data in zip(missing, parsed):
+            results[path] = _parsed_from_data(data, pending[path][0])
+
+        # Written in one go, a first scan can parse thousands of files
+        if self.cache is not None and missing:
+            self.cache.set_parsed_many(
+                (path, pending[path][0].size, pending[path][0].mtime, data)
+                for path, data in zip(missing, parsed)
+            )
+
+        return results
+
+    def _parse_parallel(self, paths: List[str]) -> List[Dict]:
+        # A few batches per worker, so one slow batch doesn't hold everything up
+        size = max(50, math.ceil(len(paths) / (self.workers * 4)))
+        batches = [paths[i : i + size] for i in range(0, len(paths), size)]
+
+        logger.info(f"Parsing {len(paths)} files with {self.workers} processes")
+
+        # Forking with Qt's threads running isn't safe, always spawn
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as executor:
+            results = executor.map(_parse_paths, batches)
+            return [data for batch in results for data in batch]
+
+    def _forget(self, path: str, diff: LibraryDiff):
+        parsed = self._parsed.pop(path, None)
+
+        if parsed is not None:
+            diff.removed.extend(parsed.episodes)
+            if parsed.subtitle is not None:
+                diff.subtitles_changed = True
+
+    def _iter_parsed(self) -> Iterator[Tuple[str, ParsedFile]]:
+        for path in sorted(self._parsed):
+            parsed = self._parsed[path]
+            if parsed is not None:
+                yield path, parsed
+
+    def _rebuild(self):
+        episodes: List[AnimeFile] = []
+        subtitles: Dict[Tuple[str, int], str] = {}
+
+        for path, parsed in self._iter_parsed():
+            episodes.extend(parsed.episodes)
+            if parsed.subtitle is not None:
+                subtitles[parsed.subtitle] = path
+
+        # Swap them in one go, other threads read these
+        self._episodes = episodes
+        self._subtitles = subtitles
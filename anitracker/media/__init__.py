@@ -1,2 +1,3 @@
 from .anime import *
+from .availability import *
 from .manga import *
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import os
 import re
 from subprocess import DEVNULL, PIPE
 import sys
@@ -15,6 +16,7 @@ from anitracker.utilities import UserStatus
 from anitracker.utilities import subprocess
 
 if TYPE_CHECKING:
+    from anitracker.cache import MetadataCache
     from anitracker.sync import AniList
 
 __all__ = (
@@ -25,7 +27,28 @@ __all__ = (
 )
 
 
-def ffprobe_data(file: str) -> Dict:
+def ffprobe_data(file: str, cache: Optional[MetadataCache] = None) -> Dict:
+    stat = None
+    if cache is not None:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            pass
+        else:
+            data = cache.get_probe(file, stat.st_size, stat.st_mtime_ns)
+            if data is not None:
+                return data
+
+    data = _run_ffprobe(file)
+
+    # Don't cache failures, the file may just not be done downloading
+    if cache is not None and stat is not None and data:
+        cache.set_probe(file, stat.st_size, stat.st_mtime_ns, data)
+
+    return data
+
+
+def _run_ffprobe(file: str) -> Dict:
     args = [ffprobe_cmd, "-show_format", "-show_streams", "-of", "json", file]
     logger.info(f"Running ffprobe command {args}")
     # I hate windows
@@ -48,6 +71,24 @@ def ffprobe_data(file: str) -> Dict:
         return {}
 
 
+def extract_thumbnail(file: str) -> bytes:
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as f:
+        cmd = [
+            ffmpeg_cmd,
+            "-ss",
+            "00:03:30.00",
+            "-i",
+            file,
+            "-vframes",
+            "1",
+            "-y",
+            f.name,
+        ]
+        subprocess.run(cmd)
+        f.seek(0)
+        return f.read()
+
+
 @dataclass
 class NyaaResult:
     title: str
@@ -103,8 +144,12 @@ class Anime(BaseAnime):
     def __eq__(self, o: object) -> bool:
         return isinstance(o, Anime) and self.id == o.id
 
-    def edit(self, sync: AniList, *, status: UserStatus):
-        sync.gql("update_entry", {"mediaId": self.id, "status": status.name})
+    def edit(self, sync: AniList, *, status: UserStatus) -> Dict:
+        ret = sync.gql("update_entry", self.edit_payload(status=status))
+        return ret["data"]["SaveMediaListEntry"]
+
+    def edit_payload(self, *, status: UserStatus) -> Dict[str, Any]:
+        return {"mediaId": self.id, "status": status.name}
 
 
 @dataclass
@@ -114,9 +159,14 @@ class AnimeCollection(BaseCollection, Anime):
 
     __str__ = __repr__
 
-    def edit(
+    def edit(self, sync: AniList, **kwargs: Any) -> Dict:
+        ret = sync.gql("update_entry", self.edit_payload(**kwargs))
+        self.update_user_data(ret["data"]["SaveMediaListEntry"])
+
+        return ret["data"]["SaveMediaListEntry"]
+
+    def edit_payload(
         self,
-        sync: AniList,
         *,
         status: Optional[UserStatus] = None,
         score: Optional[float] = None,
@@ -125,8 +175,10 @@ class AnimeCollection(BaseCollection, Anime):
         notes: Optional[str] = None,
         started_at: Optional[date] = None,
         completed_at: Optional[date] = None,
-    ):
-        payload: Dict[str, Any] = {"id": self._list_id}
+    ) -> Dict[str, Any]:
+        """The update_entry variables for these changes, the keys match what
+        update_user_data takes so it can be applied before being sent"""
+        payload: Dict[str, Any] = {"id": self._list_id, "mediaId": self.id}
 
         if status is not None:
             payload["status"] = status.name
@@ -151,32 +203,36 @@ class AnimeCollection(BaseCollection, Anime):
                 "day": started_at.day,
             }
 
-        ret = sync.gql("update_entry", payload)
-        self.update_user_data(ret["data"]["SaveMediaListEntry"])
+        return payload
 
     def update_user_data(self, data: Dict):
-        self.user_status = UserStatus[data["status"]]
-        self.score = data["score"]
-        self.notes = data["notes"]
-        self.progress = data["progress"]
-        self.repeat = data["repeat"]
-        self.updated_at = (
-            date.fromtimestamp(data["updatedAt"]) if data["updatedAt"] else None
-        )
-
-        user_start = (
-            date(**data["startedAt"])
-            if all(value for value in data["startedAt"].values())
-            else None
-        )
-        user_end = (
-            date(**data["completedAt"])
-            if all(value for value in data["completedAt"].values())
-            else None
-        )
-
-        self.user_start_date = user_start
-        self.user_end_date = user_end
+        # Only what's there is updated, so edits can be applied before anilist has them
+        if "status" in data:
+            self.user_status = UserStatus[data["status"]]
+        if "score" in data:
+            self.score = data["score"]
+        if "notes" in data:
+            self.notes = data["notes"]
+        if "progress" in data:
+            self.progress = data["progress"]
+        if "repeat" in data:
+            self.repeat = data["repeat"]
+        if "updatedAt" in data:
+            self.updated_at = (
+                date.fromtimestamp(data["updatedAt"]) if data["updatedAt"] else None
+            )
+        if "startedAt" in data:
+            self.user_start_date = (
+                date(**data["startedAt"])
+                if all(value for value in data["startedAt"].values())
+                else None
+            )
+        if "completedAt" in data:
+            self.user_end_date = (
+                date(**data["completedAt"])
+                if all(value for value in data["completedAt"].values())
+                else None
+            )
 
     def delete(self, sync: AniList):
         sync.gql("delete_entry", {"id": self._list_id})
@@ -235,32 +291,20 @@ class AnimeFile:
     @property
     def thumbnail(self):
         if self._thumbnail is None:
-            with tempfile.NamedTemporaryFile(suffix=".jpg") as f:
-                cmd = [
-                    ffmpeg_cmd,
-                    "-ss",
-                    "00:03:30.00",
-                    "-i",
-                    self.file,
-                    "-vframes",
-                    "1",
-                    "-y",
-                    f.name,
-                ]
-                subprocess.run(cmd)
-                f.seek(0)
-                image = f.read()
-
-            self._thumbnail = image
+            self._thumbnail = extract_thumbnail(self.file)
 
         return self._thumbnail
 
-    def load_subtitles(self, standalone_subs: Dict[Tuple[str, int], str]):
+    def load_subtitles(
+        self,
+        standalone_subs: Dict[Tuple[str, int], str],
+        cache: Optional[MetadataCache] = None,
+    ):
         self.subtitles = []
 
         sub_id = 1
 
-        for stream in ffprobe_data(self.file).get("streams", []):
+        for stream in ffprobe_data(self.file, cache).get("streams", []):
             if stream["codec_type"] == "subtitle":
                 # Insert the sub_id into the data
                 stream["tags"]["id"] = sub_id
@@ -270,7 +314,7 @@ class AnimeFile:
         # Now find all the matching standalone ones
         for (title, episode_number), track in standalone_subs.items():
             if title == self.title and episode_number == self.episode_number:
-                self.subtitles.append(SubtitleTrack.from_file(track))
+                self.subtitles.append(SubtitleTrack.from_file(track, cache))
 
 
 class SubtitleTrack:
@@ -299,8 +343,8 @@ class SubtitleTrack:
         return inst
 
     @classmethod
-    def from_file(cls, file: str):
-        data = ffprobe_data(file)["streams"][0]
+    def from_file(cls, file: str, cache: Optional[MetadataCache] = None):
+        data = ffprobe_data(file, cache)["streams"][0]
         data["file_name"] = file
         return cls.from_data(data)
 
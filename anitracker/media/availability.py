@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import Iterable, Iterator, List, Tuple
+
+__all__ = ("EpisodeAvailability",)
+
+
+def _ranges(numbers: Iterable[int]) -> Iterator[Tuple[int, int]]:
+    """Groups sorted numbers into (first, last) runs of consecutive numbers"""
+    first = last = None
+
+    for n in numbers:
+        if last is not None and n == last + 1:
+            last = n
+            continue
+
+        if first is not None:
+            yield first, last  # type: ignore
+        first = last = n
+
+    if first is not None:
+        yield first, last  # type: ignore
+
+
+def _set_bits(bits: int) -> List[int]:
+    return [n for n, bit in enumerate(reversed(bin(bits)[2:])) if bit == "1"]
+
+
+def _format_ranges(numbers: Iterable[int]) -> str:
+    return ", ".join(
+        str(first) if first == last else f"{first}-{last}"
+        for first, last in _ranges(numbers)
+    )
+
+
+class EpisodeAvailability:
+    """Which episodes of an anime there are files for, as a bitset where bit n
+    is set if episode n was found"""
+
+    __slots__ = ("episode_count", "_bits")
+
+    def __init__(self, episode_count: int, bits: int = 0) -> None:
+        self.episode_count = episode_count
+        self._bits = bits
+
+    @classmethod
+    def from_episodes(
+        cls, episodes: Iterable[int], episode_count: int
+    ) -> EpisodeAvailability:
+        bits = 0
+        for n in episodes:
+            if n > 0:
+                bits |= 1 << n
+
+        return cls(episode_count, bits)
+
+    def copy(self) -> EpisodeAvailability:
+        return EpisodeAvailability(self.episode_count, self._bits)
+
+    def __repr__(self) -> str:
+        return f"<EpisodeAvailability have={self.available_ranges()!r} of {self.episode_count}>"
+
+    def has(self, episode: int) -> bool:
+        return episode > 0 and bool(self._bits & (1 << episode))
+
+    def add(self, episode: int):
+        if episode > 0:
+            self._bits |= 1 << episode
+
+    def discard(self, episode: int):
+        if episode > 0:
+            self._bits &= ~(1 << episode)
+
+    @property
+    def count(self) -> int:
+        """How many episodes were found"""
+        return bin(self._bits).count("1")
+
+    def available(self) -> List[int]:
+        return _set_bits(self._bits)
+
+    def missing(self) -> List[int]:
+        """The episodes up to the episode count that weren't found"""
+        # Flip the bits for 1 to episode_count, whatever's set is missing
+        return _set_bits(~self._bits & ((1 << (self.episode_count + 1)) - 2))
+
+    def available_ranges(self) -> str:
+        """The episodes that were found, like "1-12, 14" """
+        return _format_ranges(self.available())
+
+    def missing_ranges(self) -> str:
+        """The episodes that weren't found, like "13-24, 30" """
+        return _format_ranges(self.missing())
@@ -1,6 +1,6 @@
 from datetime import date
 from dataclasses import dataclass, fields
-from typing import Dict, List, Union, Tuple
+from typing import Dict, List, Optional, Union, Tuple
 
 from anitracker.utilities import MediaStatus, UserStatus
 
@@ -12,7 +12,8 @@ class BaseMedia:
     english_title: str
     native_title: str
     preferred_title: str
-    status: MediaStatus
+    # Not set for search results that didn't select it
+    status: Optional[MediaStatus]
     description: str
     start_date: Union[date, None]
     end_date: Union[date, None]
@@ -39,53 +40,57 @@ class BaseMedia:
 
     @staticmethod
     def _transform_from_anilist(data: Dict):
+        # Queries may only select some of the fields, anything missing is left empty
+        start_date = data.get("startDate") or {}
+        end_date = data.get("endDate") or {}
+        titles = data.get("title") or {}
+        edges = (data.get("studios") or {}).get("edges", [])
+
         start = (
-            date(**data["startDate"])
-            if all(value for value in data["startDate"].values())
+            date(**start_date)
+            if start_date and all(value for value in start_date.values())
             else None
         )
         end = (
-            date(**data["endDate"])
-            if all(value for value in data["endDate"].values())
+            date(**end_date)
+            if end_date and all(value for value in end_date.values())
             else None
         )
-        studios = [
-            e["node"]["name"]
-            for e in data["studios"]["edges"]
-            if e["node"]["isAnimationStudio"]
-        ]
+        studios = [e["node"]["name"] for e in edges if e["node"]["isAnimationStudio"]]
         if studios:
             studio = studios[0]
         else:
             # Just get the first studio if we can't find an animation studio
-            if data["studios"]["edges"]:
-                studio = data["studios"]["edges"][0]
+            if edges:
+                studio = edges[0]["node"]["name"]
             else:
                 studio = ""
 
         return {
             "id": data["id"],
-            "romaji_title": data["title"]["romaji"] or "",
-            "english_title": data["title"]["english"] or "",
-            "native_title": data["title"]["native"] or "",
-            "preferred_title": data["title"]["userPreferred"] or "",
-            "status": MediaStatus[data["status"]],
-            "description": data["description"],
+            "romaji_title": titles.get("romaji") or "",
+            "english_title": titles.get("english") or "",
+            "native_title": titles.get("native") or "",
+            "preferred_title": titles.get("userPreferred") or "",
+            "status": MediaStatus[data["status"]] if data.get("status") else None,
+            "description": data.get("description") or "",
             "start_date": start,
             "end_date": end,
-            "episode_count": data["episodes"] or 0,
-            "average_score": data["averageScore"],
-            "season": f"{data['season']} {data['seasonYear']}",
-            "genres": data["genres"],
+            "episode_count": data.get("episodes") or 0,
+            "average_score": data.get("averageScore"),
+            "season": f"{data['season']} {data['seasonYear']}"
+            if "season" in data
+            else "",
+            "genres": data.get("genres") or [],
             "tags": [
                 (tag["name"], tag["rank"])
-                for tag in data["tags"]
+                for tag in data.get("tags") or []
                 if not tag["isMediaSpoiler"]
             ],
             "studio": studio,
-            "cover_image": data["coverImage"]["large"],
-            "chapters": data["chapters"],
-            "volumes": data["volumes"],
+            "cover_image": (data.get("coverImage") or {}).get("large") or "",
+            "chapters": data.get("chapters"),
+            "volumes": data.get("volumes"),
         }
 
 
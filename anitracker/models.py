@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import unicodedata
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from PySide2.QtCore import *  # type: ignore
+from PySide2.QtGui import *  # type: ignore
+from PySide2.QtWidgets import *  # type: ignore
+from rapidfuzz import fuzz
+
+from anitracker.media import Anime, AnimeCollection
+
+if TYPE_CHECKING:
+    from anitracker.anitracker import AniTracker
+
+__all__ = (
+    "AnimeRole",
+    "SortRole",
+    "AnimeTableModel",
+    "AnimeFilterProxyModel",
+    "ProgressDelegate",
+    "normalize_title",
+)
+
+# The anime a row is for, and what a column should be sorted by
+AnimeRole = Qt.UserRole + 1
+SortRole = Qt.UserRole + 2
+
+# How close a fuzzy filter has to be to part of a title
+FUZZY_FILTER_RATIO = 80
+# Romaji long vowels are written with macrons or spelled out, so both are indexed
+LONG_VOWELS = str.maketrans({"ā": "aa", "ī": "ii", "ū": "uu", "ē": "ei", "ō": "ou"})
+
+
+def normalize_title(title: str) -> str:
+    """Folds a title to what the filter compares, lowercase with full and half
+    width characters made the same and accents dropped"""
+    title = unicodedata.normalize("NFKD", unicodedata.normalize("NFKC", title).casefold())
+    # Only the latin accents, the kana voicing marks are combining marks too
+    title = "".join(c for c in title if not "\u0300" <= c <= "\u036f")
+    return unicodedata.normalize("NFC", title)
+
+
+def _title_key(anime: Union[AnimeCollection, Anime]) -> str:
+    # Every spelling of every title, one per line
+    keys: Dict[str, None] = {}
+    for title in anime.titles:
+        if title:
+            keys[normalize_title(title)] = None
+            keys[normalize_title(title.casefold().translate(LONG_VOWELS))] = None
+
+    return "\n".join(keys)
+
+
+def _display(anime: Union[AnimeCollection, Anime], attribute: str) -> Union[str, int]:
+    piece = getattr(anime, attribute, "")
+    if isinstance(piece, Enum):
+        piece = piece.name.title()
+    else:
+        piece = str(piece)
+    if piece.isdigit():
+        return int(piece)
+
+    return piece
+
+
+def _runs(rows: List[int]) -> Iterator[Tuple[int, int]]:
+    """Groups rows sorted highest first into (first, last) runs of neighbouring rows"""
+    last = first = rows[0]
+
+    for row in rows[1:]:
+        if row != first - 1:
+            yield first, last
+            last = row
+        first = row
+
+    yield first, last
+
+
+def _progress(anime: Union[AnimeCollection, Anime]) -> float:
+    if isinstance(anime, AnimeCollection) and anime.episode_count:
+        return anime.progress / anime.episode_count
+
+    return 0.0
+
+
+class AnimeTableModel(QAbstractTableModel):
+    """The animes shown in a table, a row per anime and a column per attribute.
+    Nothing is stored per cell, everything is read off the anime when it's drawn.
+    What each row showed last is kept, so an update only redraws what changed"""
+
+    def __init__(
+        self,
+        app: AniTracker,
+        columns: List[str],
+        parent: Optional[QObject] = None,
+    ) -> None:
+        super().__init__(parent)
+
+        self._app = app
+        self.columns = columns
+        self._animes: List[Union[AnimeCollection, Anime]] = []
+        # Anime id to its row, what the row's cells showed last and its titles
+        self._rows: Dict[int, int] = {}
+        self._cells: Dict[int, Tuple] = {}
+        self._titles: Dict[int, str] = {}
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._animes)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(
+        self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole
+    ) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section].replace("_", " ").title()
+
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        anime = self._animes[index.row()]
+        attribute = self.columns[index.column()]
+
+        if role == AnimeRole:
+            return anime
+
+        # The delegate draws the progress itself
+        if attribute == "progress":
+            if role == SortRole:
+                return _progress(anime)
+            elif role == Qt.ToolTipRole and isinstance(anime, AnimeCollection):
+                if missing := self._app.availability(anime).missing_ranges():
+                    return f"Missing episodes: {missing}"
+                return "Found all episodes"
+
+            return None
+        # How many episodes there are files for
+        elif attribute == "available":
+            if not isinstance(anime, AnimeCollection):
+                return None
+
+            availability = self._app.availability(anime)
+            if role in (Qt.DisplayRole, SortRole):
+                return availability.count
+            elif role == Qt.ToolTipRole:
+                return availability.available_ranges() or "No episodes found"
+
+            return None
+
+        if role in (Qt.DisplayRole, SortRole):
+            return _display(anime, attribute)
+        elif role == Qt.ToolTipRole:
+            return str(_display(anime, attribute))
+
+        return None
+
+    def anime(self, row: int) -> Union[AnimeCollection, Anime]:
+        return self._animes[row]
+
+    def animes(self) -> List[Union[AnimeCollection, Anime]]:
+        return list(self._animes)
+
+    def row_of(self, anime: Union[AnimeCollection, Anime]) -> int:
+        return self._rows.get(anime.id, -1)
+
+    def title_key(self, anime: Union[AnimeCollection, Anime]) -> str:
+        """The anime's titles as the filter compares them"""
+        return self._titles[anime.id]
+
+    def _cell(self, anime: Union[AnimeCollection, Anime], attribute: str) -> Any:
+        # What a cell shows, used to tell which cells changed
+        if not isinstance(anime, AnimeCollection) and attribute in (
+            "progress",
+            "available",
+        ):
+            return None
+        elif attribute == "progress":
+            return anime.progress, anime.episode_count
+        elif attribute == "available":
+            return self._app.availability(anime).available()
+
+        return _display(anime, attribute)
+
+    def _snapshot(self, anime: Union[AnimeCollection, Anime]) -> Tuple:
+        return tuple(self._cell(anime, attribute) for attribute in self.columns)
+
+    def _remember(self, anime: Union[AnimeCollection, Anime]):
+        self._cells[anime.id] = self._snapshot(anime)
+        self._titles[anime.id] = _title_key(anime)
+
+    def _forget(self, anime: Union[AnimeCollection, Anime]):
+        self._cells.pop(anime.id, None)
+        self._titles.pop(anime.id, None)
+
+    def _reindex(self):
+        self._rows = {anime.id: row for row, anime in enumerate(self._animes)}
+
+    def _redraw(self, row: int, anime: Union[AnimeCollection, Anime]):
+        # Only the span of cells that changed is redrawn, if any did
+        previous = self._cells.get(anime.id)
+        self._remember(anime)
+        cells = self._cells[anime.id]
+
+        if previous is None:
+            changed = list(range(len(self.columns)))
+        else:
+            changed = [i for i, (a, b) in enumerate(zip(cells, previous)) if a != b]
+
+        if changed:
+            self.dataChanged.emit(  # type: ignore
+                self.index(row, changed[0]), self.index(row, changed[-1])
+            )
+
+    def set_animes(self, animes: List[Union[AnimeCollection, Anime]]):
+        """Shows these animes instead, starting over"""
+        self.beginResetModel()
+        self._animes = list(animes)
+        self._cells = {}
+        self._titles = {}
+        for anime in self._animes:
+            self._remember(anime)
+        self._reindex()
+        self.endResetModel()
+
+    def reconcile(self, animes: List[Union[AnimeCollection, Anime]]):
+        """Shows these animes instead, only removing the rows that are gone,
+        redrawing the cells that changed and adding the animes that are new"""
+        new = {anime.id: anime for anime in animes}
+
+        # From the bottom up, so the rows above a run don't move while removing it
+        gone = [row for row, a in enumerate(self._animes) if a.id not in new]
+        if gone:
+            for first, last in _runs(gone[::-1]):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                for anime in self._animes[first : last + 1]:
+                    self._forget(anime)
+                del self._animes[first : last + 1]
+                self.endRemoveRows()
+
+            self._reindex()
+
+        for row, anime in enumerate(self._animes):
+            self._animes[row] = new[anime.id]
+            self._redraw(row, new[anime.id])
+
+        added = [anime for anime in animes if anime.id not in self._rows]
+        if added:
+            first = len(self._animes)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            for row, anime in enumerate(added, first):
+                self._animes.append(anime)
+                self._rows[anime.id] = row
+                self._remember(anime)
+            self.endInsertRows()
+
+    def append(self, anime: Union[AnimeCollection, Anime]):
+        row = len(self._animes)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._animes.append(anime)
+        self._rows[anime.id] = row
+        self._remember(anime)
+        self.endInsertRows()
+
+    def update(self, anime: Union[AnimeCollection, Anime]) -> bool:
+        """Redraws the anime's row, returns False if it isn't in this table"""
+        row = self.row_of(anime)
+        if row < 0:
+            return False
+
+        self._animes[row] = anime
+        self._redraw(row, anime)
+        return True
+
+    def remove(self, anime: Union[AnimeCollection, Anime]) -> bool:
+        """Removes the anime's row, returns False if it isn't in this table"""
+        row = self.row_of(anime)
+        if row < 0:
+            return False
+
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._animes[row]
+        self._forget(anime)
+        self._reindex()
+        self.endRemoveRows()
+        return True
+
+    def clear(self):
+        self.set_animes([])
+
+
+class AnimeFilterProxyModel(QSortFilterProxyModel):
+    """Sorts a table by each column's sort role, and hides the animes
+    whose titles don't match the filter text. Whether an anime matched is
+    kept, so typing more only has to test the animes that still matched"""
+
+    def __init__(self, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+
+        self._filter = ""
+        self._fuzzy = False
+        # Anime id to the titles it was tested against and whether they matched
+        self._matches: Dict[int, Tuple[str, bool]] = {}
+        self.setSortRole(SortRole)
+
+    def sourceModel(self) -> AnimeTableModel:
+        return super().sourceModel()  # type: ignore
+
+    def _test(self, title: str) -> bool:
+        if self._fuzzy:
+            return fuzz.partial_ratio(self._filter, title) >= FUZZY_FILTER_RATIO
+
+        return self._filter in title
+
+    def set_filter_text(self, text: str, *, fuzzy: bool = False):
+        text = normalize_title(text).strip()
+        if text == self._filter and fuzzy == self._fuzzy:
+            return
+
+        # Adding to an exact filter can only hide more, anything that didn't
+        # match already is left as is. Otherwise everything is tested again
+        narrowing = (
+            self._filter and not fuzzy and not self._fuzzy and text.startswith(self._filter)
+        )
+        previous = self._matches if narrowing else {}
+
+        self._filter = text
+        self._fuzzy = fuzzy
+        self._matches = {
+            anime_id: (title, matched and self._test(title))
+            for anime_id, (title, matched) in previous.items()
+        }
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if not self._filter:
+            return True
+
+        model = self.sourceModel()
+        anime = model.anime(source_row)
+        title = model.title_key(anime)
+
+        # Animes added since, or whose titles changed, are tested now
+        match = self._matches.get(anime.id)
+        if match is None or match[0] != title:
+            match = self._matches[anime.id] = (title, self._test(title))
+
+        return match[1]
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    """Paints the progress column as a bar, so there's no progress bar widget
+    needed for every row"""
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        # Selection and the alternating row colors
+        super().paint(painter, option, index)
+
+        anime = index.data(AnimeRole)
+        # Don't show progress bar if there are no episodes
+        if not isinstance(anime, AnimeCollection) or not anime.episode_count:
+            return
+
+        rect = QRectF(option.rect).adjusted(9, 9, -9, -9)
+        text = f"{anime.progress}/{anime.episode_count}"
+        # The bar leaves room to the right for the text
+        bar = rect.adjusted(0, 0, -option.fontMetrics.width(text) - 8, 0)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(QColor("grey"), 2))
+        painter.setBrush(QColor(68, 68, 68))
+        painter.drawRoundedRect(bar, 5, 5)
+
+        chunk = bar.adjusted(2, 2, -2, -2)
+        chunk.setWidth(chunk.width() * min(_progress(anime), 1.0))
+        painter.fillRect(chunk, QColor("#05B8CC"))
+
+        painter.setPen(QColor(212, 212, 212))
+        painter.drawText(rect, Qt.AlignRight | Qt.AlignVCenter, text)
+        painter.restore()
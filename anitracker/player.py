@@ -42,7 +42,7 @@ class Player:
         eps = []
 
         for ep in self._standalone_episodes:
-            ep.load_subtitles(self._parent.standalone_subtitles)
+            ep.load_subtitles(self._parent.standalone_subtitles, self._parent._cache)
             sub = self._get_sub_for_episode(ep)
 
             eps.append((ep, sub))
@@ -213,10 +213,10 @@ class Player:
         ):
             vars["started_at"] = datetime.now().date()
 
-        self.anime.edit(self._parent._anilist, **vars)
+        self._parent.edit_anime(self.anime, **vars)
 
-        # Now trigger an update of the app
-        self._window.anime_updater.start()
+        # The edit already updated the anime, just show it
+        self._window.anime_updated.emit(self.anime)  # type: ignore
 
     def _save_position_for_episode(
         self, episode: AnimeFile, anime: AnimeCollection, position: str
@@ -1,14 +1,14 @@
 from __future__ import annotations
 
 
-from enum import Enum
 import os
 import re
 import pycountry
 import shlex
 import sys
 import webbrowser
-from typing import Callable, TYPE_CHECKING, List, Union, cast, Optional
+from concurrent.futures import Future
+from typing import Any, Callable, TYPE_CHECKING, Dict, List, Tuple, Union, Optional
 
 from PySide2.QtCore import *  # type: ignore
 from PySide2.QtGui import *  # type: ignore
@@ -17,7 +17,8 @@ from PySide2.QtWidgets import *  # type: ignore
 from anitracker import __version__
 from anitracker.ui import Ui_About, Ui_Settings, Ui_animeEpisode
 from anitracker.media import Anime, AnimeCollection, AnimeFile
-from anitracker.utilities import UserStatus, QProgressIndicator, subprocess
+from anitracker.models import AnimeRole
+from anitracker.utilities import TaskPriority, UserStatus, subprocess
 from anitracker.background import *
 
 if TYPE_CHECKING:
@@ -34,33 +35,6 @@ def _open_magnet(magnet: str):
         subprocess.Popen(cmd)
 
 
-class HiddenProgressBarItem(QTableWidgetItem):
-    def __init__(self, anime: Union[AnimeCollection, Anime]) -> None:
-        super().__init__("")
-        self.anime = anime
-
-    @property
-    def amount(self) -> float:
-        if isinstance(self.anime, AnimeCollection):
-            return (
-                self.anime.progress / self.anime.episode_count
-                if self.anime.episode_count
-                else 0.0
-            )
-        else:
-            return 0.0
-
-    def __lt__(self, other):
-        return self.amount < other.amount
-
-
-class AnimeWidgetItem(QTableWidgetItem):
-    def __init__(self, anime: Union[AnimeCollection, Anime]):
-        super().__init__()
-
-        self.anime = anime
-
-
 class LinkWidgetItem(QTableWidgetItem):
     def __init__(self, magnet: str, link: str):
         super().__init__()
@@ -84,46 +58,48 @@ class EpisodeWidget(QWidget):
         super().__init__(parent=parent)
 
     def mouseDoubleClickEvent(self, event: QMouseEvent) -> None:
-        self._playing_episode = BackgroundThread(
+        self._window.tasks.submit(
             play_episode,
             self._anime,
             self._file.episode_number,
             self._window,
             start_playlist=self._anime.progress == self._file.episode_number - 1,
+            key=("play_episode", self._anime.id, self._file.episode_number),
+            priority=TaskPriority.UI,
         )
-        self._playing_episode.start()
         return super().mouseDoubleClickEvent(event)
 
 
 class MouseFilter(QObject):
-    def __init__(self, table: QTableWidget, parent: Optional[QObject] = None) -> None:
+    def __init__(self, table: QTableView, parent: Optional[QObject] = None) -> None:
         super().__init__(parent=parent)
 
         self._table = table
-        self._playing_episode: Union[BackgroundThread, None] = None
 
     def mousebuttonrelease_middlebutton(
         self,
         window: MainWindow,
-        item: Union[AnimeWidgetItem, LinkWidgetItem],
+        item: Union[AnimeCollection, Anime, LinkWidgetItem, None],
     ):
-        if isinstance(item, AnimeWidgetItem) and isinstance(
-            item.anime, AnimeCollection
-        ):
-            self._playing_episode = BackgroundThread(
-                play_episode, item.anime, item.anime.progress + 1, window
+        if isinstance(item, AnimeCollection):
+            window.tasks.submit(
+                play_episode,
+                item,
+                item.progress + 1,
+                window,
+                key=("play_episode", item.id, item.progress + 1),
+                priority=TaskPriority.UI,
             )
-            self._playing_episode.start()
         elif isinstance(item, LinkWidgetItem):
             _open_magnet(item.magnet)
 
     def mousebuttondblclick_leftbutton(
         self,
         window: MainWindow,
-        item: Union[AnimeWidgetItem, LinkWidgetItem],
+        item: Union[AnimeCollection, Anime, LinkWidgetItem, None],
     ):
-        if isinstance(item, AnimeWidgetItem):
-            window.open_anime_settings(item.anime)
+        if isinstance(item, Anime):
+            window.open_anime_settings(item)
         elif isinstance(item, LinkWidgetItem):
             _open_magnet(item.magnet)
 
@@ -133,8 +109,11 @@ class MouseFilter(QObject):
         if not isinstance(event, QMouseEvent):
             return super().eventFilter(watched, event)
 
-        # Get the item at that position
-        item = self._table.itemAt(event.pos())
+        # Get the item at that position, or the anime for that row
+        if isinstance(self._table, QTableWidget):
+            item = self._table.itemAt(event.pos())
+        else:
+            item = self._table.indexAt(event.pos()).data(AnimeRole)
 
         t = event.type().name.decode("utf-8")  # type: ignore
         b = event.button().name.decode("utf-8")  # type: ignore
@@ -151,6 +130,10 @@ class SignalConnector:
     def __init__(self, window: MainWindow) -> None:
         self.window = window
         self._episodes = []
+        # The anime currently shown in the episode list, and its thumbnails
+        self._showing_anime: Optional[AnimeCollection] = None
+        self._thumbnail_labels: Dict[Tuple[str, int], QLabel] = {}
+        self._thumbnail_futures: List[Future] = []
 
     # Settings action was clicked
     def open_settings(self):
@@ -217,13 +200,14 @@ class SignalConnector:
             )
 
     # Header context menu option selected
-    def header_changed(self, table: QTableWidget, _action: QAction):
+    def header_changed(self, table: QTableView, _action: QAction):
         all_hidden = True
+        model = table.model()
 
         # Loop through each column
-        for index in range(table.columnCount()):
+        for index in range(model.columnCount()):
             # Get the text for this header
-            text = table.horizontalHeaderItem(index).text()
+            text = model.headerData(index, Qt.Horizontal)
             # If this is the text that matters
             if text == _action.text():
                 table.setColumnHidden(index, not _action.isChecked())
@@ -242,8 +226,8 @@ class SignalConnector:
         # Check if there are no headers shown for this table, if there are
         # show the title/preferred title
         if all_hidden:
-            for index in range(table.columnCount()):
-                text = table.horizontalHeaderItem(index).text()
+            for index in range(model.columnCount()):
+                text = model.headerData(index, Qt.Horizontal)
                 if text == "Title" or text == "Preferred Title":
                     # Found our title column, set it as not hidden
                     table.setColumnHidden(index, False)
@@ -262,20 +246,29 @@ class SignalConnector:
                     break
 
     # Header was right clicked
-    def open_header_menu(self, table: QTableWidget, point: QPoint):
+    def open_header_menu(self, table: QTableView, point: QPoint):
         table.menu.exec_(self.window.ui.AnimeListTab.mapToGlobal(point))  # type: ignore
 
-    def open_anime_context_menu(self, table: QTableWidget, _: QPoint):
-        item = table.selectedItems()[0]
-        if isinstance(item, (AnimeWidgetItem, HiddenProgressBarItem)):
-            self._open_anime_context_menu(table, item.anime)
-        elif isinstance(item, LinkWidgetItem):
-            self._open_nyaa_context_menu(table, item)
+    def open_anime_context_menu(self, table: QTableView, _: QPoint):
+        if isinstance(table, QTableWidget):
+            items = table.selectedItems()
+            if items and isinstance(items[0], LinkWidgetItem):
+                self._open_nyaa_context_menu(table, items[0])
+            return
+
+        animes = [index.data(AnimeRole) for index in table.selectionModel().selectedRows()]
+        if animes:
+            self._open_anime_context_menu(table, animes)
 
-    # Anime in table was right clicked
+    # Anime in table was right clicked, status changes apply to every selected
+    # anime, everything else only when one is selected
     def _open_anime_context_menu(
-        self, table: QTableWidget, anime: Union[AnimeCollection, Anime]
+        self, table: QTableView, animes: List[Union[AnimeCollection, Anime]]
     ):
+        anime = animes[0]
+        single = len(animes) == 1
+        collections = [a for a in animes if isinstance(a, AnimeCollection)]
+
         # Just to shut up the linter
         remove = None
         folder = ""
@@ -295,6 +288,7 @@ class SignalConnector:
 
         # Add misc actions
         settings = menu.addAction("Anime info")
+        settings.setEnabled(single)
 
         menu.addSeparator()
 
@@ -304,12 +298,12 @@ class SignalConnector:
         watch = menu.addAction("Watching")
         drop = menu.addAction("Dropped")
 
-        if isinstance(anime, AnimeCollection):
+        if len(collections) == len(animes):
             remove = menu.addAction("Remove from list")
 
         menu.addSeparator()
 
-        if isinstance(anime, AnimeCollection):
+        if isinstance(anime, AnimeCollection) and single:
             # Add episode options
             open_folder = menu.addAction("Open anime folder")
             open_folder.setToolTip(
@@ -347,6 +341,7 @@ class SignalConnector:
         
         # Add a way to search nyaa based on the title
         search_nyaa = menu.addAction("Search nyaa")
+        search_nyaa.setEnabled(single)
 
         action = menu.exec_(QCursor.pos())
 
@@ -354,22 +349,42 @@ class SignalConnector:
         if action is None:
             return
 
+        statuses = {
+            plan: UserStatus.PLANNING,
+            complete: UserStatus.COMPLETED,
+            watch: UserStatus.CURRENT,
+            drop: UserStatus.DROPPED,
+        }
+
         if action == settings:
             self.window.open_anime_settings(anime)
-        elif action == plan:
-            anime.edit(self.window.app._anilist, status=UserStatus.PLANNING)
-        elif action == complete:
-            anime.edit(self.window.app._anilist, status=UserStatus.COMPLETED)
-        elif action == watch:
-            if (
-                isinstance(anime, AnimeCollection)
-                and anime.user_status == UserStatus.COMPLETED
-            ):
-                anime.edit(self.window.app._anilist, status=UserStatus.REPEATING)
-            else:
-                anime.edit(self.window.app._anilist, status=UserStatus.CURRENT)
-        elif action == drop:
-            anime.edit(self.window.app._anilist, status=UserStatus.DROPPED)
+        elif action in statuses:
+            edits: List[Tuple[Union[AnimeCollection, Anime], Dict[str, Any]]] = []
+
+            for selected in animes:
+                status = statuses[action]
+
+                # Watching something that's completed is a rewatch
+                if (
+                    status is UserStatus.CURRENT
+                    and isinstance(selected, AnimeCollection)
+                    and selected.user_status == UserStatus.COMPLETED
+                ):
+                    status = UserStatus.REPEATING
+
+                edits.append((selected, {"status": status}))
+
+            # These are all queued at once, and sent to anilist together
+            self.window.app.edit_animes(edits)
+
+            # New entries only show up once anilist has them
+            for selected in collections:
+                self.update_anime_row(selected)
+        elif action == remove:
+            self.window.app.delete_animes(collections)
+
+            for selected in collections:
+                self.remove_anime_row(selected)
         elif action == search_nyaa:
             self.window.ui.AnimePages.setCurrentIndex(1)
             self.window.ui.SearchTabs.setCurrentIndex(1)
@@ -378,38 +393,31 @@ class SignalConnector:
 
         # Anime Collection specific items
         if isinstance(anime, AnimeCollection):
-            if action == remove:
-                anime.delete(self.window.app._anilist)
-                self.window.app.remove_anime(anime.id)
-            elif action == open_folder and folder is not None:
+            if action == open_folder and folder is not None:
                 if sys.platform.startswith("win32"):
                     subprocess.Popen(["start", folder], shell=True)
                 elif sys.platform.startswith("linux"):
                     subprocess.Popen(["xdg-open", folder])
             elif action == play_next:
-                self._playing_episode = BackgroundThread(
-                    play_episode, anime, next_ep, self.window
+                self.window.tasks.submit(
+                    play_episode,
+                    anime,
+                    next_ep,
+                    self.window,
+                    key=("play_episode", anime.id, next_ep),
+                    priority=TaskPriority.UI,
                 )
-                self._playing_episode.start()
             elif action in play_opts:
-                self._playing_episode = BackgroundThread(
+                self.window.tasks.submit(
                     play_episode,
                     anime,
                     play_opts[action],
                     self.window,
                     start_playlist=False,
+                    key=("play_episode", anime.id, play_opts[action]),
+                    priority=TaskPriority.UI,
                 )
-                self._playing_episode.start()
-
-        # If we've modified something with an anime, update it
-        if action in [
-            plan,
-            complete,
-            watch,
-            drop,
-            remove,
-        ]:
-            self.window.anime_updater.start()
+
 
     # Anime in nyaa was right clicked
     def _open_nyaa_context_menu(self, table: QTableWidget, item: LinkWidgetItem):
@@ -465,45 +473,26 @@ class SignalConnector:
 
     # Update all animes from anilist
     def handle_anime_updates(self):
-        animes = list(self.window.app.animes.values())
-
-        # First, handle any animes in the tables but not in the list of animes
-        for table in self.window.tables:
-            # Reverse through the range, so that removal of rows
-            # doesn't mess up what we're looking at
-            for row in range(table.rowCount() - 1, -1, -1):
-                anime: AnimeCollection = table.item(row, 0).anime  # type: ignore
-
-                # If the anime is not in the list, remove it from the table
-                if anime not in animes:
-                    table.removeRow(row)
-                # Otherwise if this table doesn't match the anime's status, remove it
-                elif self.window.get_table(anime.user_status) != table:
-                    table.removeRow(row)
-
-        # Now loop through the animes and handle all the updates
-        for anime in animes:
-            found = False
-            table = self.window.get_table(anime.user_status)
-
-            # Loop through every row in the table it should be in
-            for row in range(table.rowCount()):
-                # Found it
-                if cast(AnimeWidgetItem, table.item(row, 0)).anime == anime:
-                    found = True
-                    self.window.update_row_signal.emit(table, row, anime)  # type: ignore
-
-            # If we didn't find it, then insert it
-            if not found:
-                self.window.insert_row_signal.emit(table, anime)  # type: ignore
-
-        # Make sure things are sorted properly
-        for table in self.window.tables:
-            if table.isSortingEnabled():
-                # This will immediately trigger a sort based on the sort option
-                # selected, so we just set it to True again, since as far as I can
-                # tell there's no way to GET the current sort option
-                table.setSortingEnabled(True)
+        animes: Dict[QTableView, List[AnimeCollection]] = {
+            table: [] for table in self.window.tables
+        }
+
+        for anime in self.window.app.animes.values():
+            animes[self.window.get_table(anime.user_status)].append(anime)
+
+        # Only what changed is applied, with sorting and drawing held off until
+        # the whole batch is in so each table is only sorted and drawn once
+        for table, table_animes in animes.items():
+            proxy: QSortFilterProxyModel = table.model()  # type: ignore
+            table.setUpdatesEnabled(False)
+            proxy.setDynamicSortFilter(False)
+
+            try:
+                self.window.model(table).reconcile(table_animes)
+            finally:
+                # Turning it back on sorts everything that came in
+                proxy.setDynamicSortFilter(True)
+                table.setUpdatesEnabled(True)
 
     # Toggle visible success label
     def toggle_success(self):
@@ -516,10 +505,16 @@ class SignalConnector:
         notes = self.window.anime_window.AnimeNotes.toPlainText()
         score = self.window.anime_window.AnimeUserScore.value()
 
-        self._anime_editing_thread = BackgroundThread(
-            edit_anime, self.window, anime, notes=notes, score=score
+        self.window.tasks.submit(
+            edit_anime,
+            self.window,
+            anime,
+            notes=notes,
+            score=score,
+            key=("edit_anime", anime.id),
+            priority=TaskPriority.UI,
+            requeue=True,
         )
-        self._anime_editing_thread.start()
 
     # About was clicked
     def open_about(self):
@@ -539,38 +534,32 @@ class SignalConnector:
     def open_repo(self):
         webbrowser.open("https://github.com/Phxntxm/AniTracker")
 
-    # Filter anime was typed in
-    def filter_row(self, text: str):
+    # Filter anime was typed in, and typing stopped for a moment
+    def filter_row(self):
+        text = self.window.filter_anime.text()
+        fuzzy = bool(self.window.app._config["filter_fuzzy"])
+
         for table in self.window.tables + [
             self.window.ui.AnilistSearchResults,
         ]:
-            for row in range(table.rowCount()):
-                anime = cast(AnimeWidgetItem, table.item(row, 0)).anime
-                if (
-                    text.lower() in anime.english_title.lower()
-                    or text.lower() in anime.romaji_title.lower()
-                    or text.lower() in anime.native_title.lower()
-                ):
-                    table.setRowHidden(row, False)
-                else:
-                    table.setRowHidden(row, True)
+            table.model().set_filter_text(text, fuzzy=fuzzy)  # type: ignore
         # Handle nyaa separate since it's not attached to an anime
         table = self.window.ui.NyaaSearchResults
+        text = text.lower()
         for row in range(table.rowCount()):
             title = table.item(row, 0).text()
-            if text.lower() in title.lower():
+            if text in title.lower():
                 table.setRowHidden(row, False)
             else:
                 table.setRowHidden(row, True)
 
-    # Status update needs to be triggered
+    # A status was added, changed or removed
     def update_status(self):
-        try:
-            status = self.window.statuses[0]
-        except IndexError:
+        status = self.window.statuses.current()
+        if status is None:
             self.window.ui.StatusLabel.setText("")
         else:
-            self.window.ui.StatusLabel.setText(status.status)
+            self.window.ui.StatusLabel.setText(status.text)
             self.window.ui.StatusLabel.setStyleSheet(f"color: {status.color}")
 
     # Language option was changed
@@ -583,23 +572,27 @@ class SignalConnector:
     def change_page(self, row: int):
         self.window.ui.AnimePages.setCurrentIndex(row)
 
-    # An anime item was clicked
-    def anime_clicked(self, item: Union[AnimeWidgetItem, LinkWidgetItem]):
-        # Links don't show the banner, nor do they show episodes
-        if isinstance(item, LinkWidgetItem):
-            self.window.hide_episode_list()
-            return
+    # An anime row was clicked, nyaa results just hide the episodes
+    def anime_clicked(self, table: QTableView, index: QModelIndex):
+        anime: Union[AnimeCollection, Anime] = index.data(AnimeRole)
 
-        # Otherwise show the banner
-        self.window.ui.BannerViewer.setUrl(QUrl(item.anime.cover_image))
+        # Show the banner
+        self.window.ui.BannerViewer.setUrl(QUrl(anime.cover_image))
 
         # Only anime collections (ones on lists) are things we care about for episodes
-        if not isinstance(item.anime, AnimeCollection):
+        if not isinstance(anime, AnimeCollection):
             self.window.hide_episode_list()
             return
 
         ew = self.window.ui.episodesWidget
 
+        # Stop generating thumbnails for whatever was showing before
+        for future in self._thumbnail_futures:
+            future.cancel()
+        self._thumbnail_futures = []
+        self._thumbnail_labels = {}
+        self._showing_anime = None
+
         # Clear all the children of the episode layout
         for index in range(ew.layout().count()):
             child = ew.layout().itemAt(index)
@@ -607,7 +600,7 @@ class SignalConnector:
 
         # Sort all the episodes
         episodes = sorted(
-            self.window.app.get_episodes(item.anime), key=lambda e: e.episode_number
+            self.window.app.get_episodes(anime), key=lambda e: e.episode_number
         )
 
         # If there are none, then we can't show them of course
@@ -615,25 +608,30 @@ class SignalConnector:
             self.window.hide_episode_list()
             return
 
-        # If there are, show the episode list and add all the episodes
+        # If there are, show the episode list and add all the episodes right away,
+        # the thumbnails get filled in as they're generated
         self.window.show_episode_list()
-        self._progress = QProgressIndicator(ew)
-        self._progress.startAnimation()
-        ew.layout().addWidget(self._progress)
+        self._showing_anime = anime
+        self.add_episodes_to_episode_list(episodes, anime)
 
-        self.thumbnail_generator = BackgroundThread(
-            generate_thumbnails, self.window, episodes, item.anime
+        # Start with the next episode to watch, then the rest of the unwatched ones
+        progress = anime.progress
+        prioritized = sorted(
+            episodes, key=lambda e: (e.episode_number <= progress, e.episode_number)
+        )
+        self._thumbnail_futures = generate_thumbnails(
+            self.window, prioritized, anime
         )
-        self.thumbnail_generator.start()
 
-    # Thumbnails generated, add to widget
+    # Episodes for the clicked anime, add to widget
     def add_episodes_to_episode_list(
         self, episodes: List[AnimeFile], anime: AnimeCollection
     ):
         ew = self.window.ui.episodesWidget
 
-        # Clear the loading widget
-        self._progress.deleteLater()
+        # Shown until the real thumbnail is ready
+        placeholder = QPixmap(240, 135)
+        placeholder.fill(QColor(40, 40, 40))
 
         for episode in episodes:
             # Create widget under episodes widget
@@ -660,26 +658,50 @@ class SignalConnector:
                     break
 
             ep_widget.animeEpisodeLabel.setText(l)
-            # Add the pixmap from generated thumbnail
-            pixmap = QPixmap()
-            pixmap.loadFromData(QByteArray(episode.thumbnail))
-            ep_widget.animeThumbnail.setPixmap(pixmap)
+            ep_widget.animeThumbnail.setPixmap(placeholder)
+            self._thumbnail_labels[
+                (episode.file, episode.episode_number)
+            ] = ep_widget.animeThumbnail
+
+    # A thumbnail finished generating, fill it in if it's still showing
+    def set_episode_thumbnail(
+        self, episode: AnimeFile, anime: AnimeCollection, thumbnail: bytes
+    ):
+        if anime is not self._showing_anime:
+            return
+
+        label = self._thumbnail_labels.get((episode.file, episode.episode_number))
+        if label is None:
+            return
+
+        pixmap = QPixmap()
+        pixmap.loadFromData(QByteArray(thumbnail))
+        label.setPixmap(pixmap)
 
     # Search anilist
     def search_anilist(self):
-        self.window.ui.AnilistSearchResults.setRowCount(0)
-        self.anilist_search_task = BackgroundThread(
-            search_anilist, self.window, self.window.ui.AnilistSearchLineEdit.text()
+        self.window.model(self.window.ui.AnilistSearchResults).clear()
+        # Only the latest search matters
+        self.window.tasks.submit(
+            search_anilist,
+            self.window,
+            self.window.ui.AnilistSearchLineEdit.text(),
+            self.window.visible_attributes(self.window.ui.AnilistSearchResults),
+            key="search_anilist",
+            priority=TaskPriority.UI,
+            replace=True,
         )
-        self.anilist_search_task.start()
 
     # Start nyaa search
     def search_nyaa(self):
-        self.nyaa_search_task = BackgroundThread(
-            search_nyaa, self.window, self.window.ui.NyaaSearchLineEdit.text()
+        self.window.tasks.submit(
+            search_nyaa,
+            self.window,
+            self.window.ui.NyaaSearchLineEdit.text(),
+            key="search_nyaa",
+            priority=TaskPriority.UI,
+            replace=True,
         )
-        self.nyaa_search_task.start()
-        self.window.nyaa_results.connect(self.nyaa_results)  # type: ignore
 
     # Results from the nyaa search
     def nyaa_results(self, results: List[NyaaResult]):
@@ -704,121 +726,37 @@ class SignalConnector:
                 nyaa.setItem(nyaa.rowCount() - 1, i, item)
 
     # Insert a row into the specified table
-    def insert_row(self, table: QTableWidget, anime: Union[AnimeCollection, Anime]):
-        row_pos = table.rowCount()
-        table.insertRow(row_pos)
+    def insert_row(self, table: QTableView, anime: Union[AnimeCollection, Anime]):
+        self.window.model(table).append(anime)
 
-        if isinstance(anime, AnimeCollection):
-
-            # Add the progress bar at position 0
-            bar = QProgressBar()
-            # bar.setMinimum(0)
-            bar.setMaximum(anime.episode_count)
-            # bar.setMaximumHeight(15)
-            bar.setStyleSheet(
-                """
-                QProgressBar {
-                    border: 2px solid grey;
-                    border-radius: 5px;
-                    background-color: rgb(68, 68, 68);
-                    vertical-align: middle;
-                }
-                QProgressBar:horizontal {
-                    text-align: right;
-                    margin-right: 8ex;
-                    padding: 1px;
-                }
-                QProgressBar::chunk {
-                    background-color: #05B8CC;
-                    width: 1px;
-                }
-                """
-            )
-            cell_widget = QWidget()
-            layout = QHBoxLayout()
-            layout.addWidget(bar)
-            cell_widget.setLayout(layout)
-
-            bar.setValue(anime.progress)
-            bar.setFormat("%v/%m")
-            # Don't show progress bar if there are no episodes
-            if anime.episode_count == 0:
-                bar.setVisible(False)
-
-            if missing := self.window.app.missing_eps(anime):
-                tt = f"Missing episodes: {missing}"
-            else:
-                tt = "Found all episodes"
-
-            bar.setToolTip(tt)
-            table.setCellWidget(row_pos, 0, cell_widget)
-            # Add an item along with the progressbar to enable sorting
-            item = HiddenProgressBarItem(anime)
-            table.setItem(row_pos, 0, item)
-
-        for index in range(table.columnCount()):
-            header = table.horizontalHeaderItem(index).text().lower().replace(" ", "_")
-            # Skip the progress, we handled that already
-            if header == "progress":
-                continue
-
-            piece = getattr(anime, header, "")
-            if isinstance(piece, Enum):
-                piece = piece.name.title()
-            else:
-                piece = str(piece)
-            if piece.isdigit():
-                piece = int(piece)
-
-            # Create our custom anime widget item
-            item = AnimeWidgetItem(anime)
-            item.setData(Qt.DisplayRole, piece)  # type: ignore
-            item.setToolTip(str(piece))
-            table.setItem(row_pos, index, item)
-
-        # # Make sure things are sorted properly
-        if table.isSortingEnabled():
-            # This will immediately trigger a sort based on the sort option
-            # selected, so we just set it to True again, since as far as I can
-            # tell there's no way to GET the current sort option
-            table.setSortingEnabled(True)
-
-    # Update a specific row to an anime
-    def update_row(self, table: QTableWidget, row: int, anime: AnimeCollection):
-        # Set the progress bar's data
-        bar = cast(QProgressBar, table.cellWidget(row, 0).findChild(QProgressBar))
-        bar.setMaximum(anime.episode_count)
-        bar.setValue(anime.progress)
-        if anime.episode_count:
-            table.item(row, 0).setData(
-                Qt.UserRole, anime.progress / anime.episode_count  # type: ignore
-            )
+    def _find_anime_table(self, anime: AnimeCollection) -> Optional[QTableView]:
+        for table in self.window.tables:
+            if self.window.model(table).row_of(anime) >= 0:
+                return table
 
-        if missing := self.window.app.missing_eps(anime):
-            bar.setToolTip(f"Missing episodes: {missing}")
-        else:
-            bar.setToolTip("Found all episodes")
+        return None
 
-        # Now loop through the normal headers
-        for index, attr in enumerate(self.window._header_labels):
-            piece = getattr(anime, attr, "")
+    # A single anime changed, update just its row, moving it if the status changed
+    def update_anime_row(self, anime: AnimeCollection):
+        table = self._find_anime_table(anime)
+        new_table = self.window.get_table(anime.user_status)
 
-            # Skip the progress, we handled that already
-            if attr == "progress":
-                continue
+        if table is new_table:
+            self.window.model(table).update(anime)
+        else:
+            if table is not None:
+                self.window.model(table).remove(anime)
+            self.insert_row(new_table, anime)
 
-            if isinstance(piece, Enum):
-                piece = piece.name.title()
-            else:
-                piece = str(piece)
-            if piece.isdigit():
-                piece = int(piece)
+    # A single anime was removed from the lists
+    def remove_anime_row(self, anime: AnimeCollection):
+        table = self._find_anime_table(anime)
 
-            table.item(row, index).setData(Qt.DisplayRole, piece)  # type: ignore
-            table.item(row, index).setToolTip(str(piece))
+        if table is not None:
+            self.window.model(table).remove(anime)
 
     # Column was resized in a table
-    def resized_column(self, table: QTableWidget, column: int, _: int, size: int):
+    def resized_column(self, table: QTableView, column: int, _: int, size: int):
         # This happens on initial startup
         if size == 0:
             return
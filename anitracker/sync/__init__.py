@@ -1 +1,2 @@
-from .anilist import AniList
+from .anilist import AniList, AsyncAniList
+from .queue import Mutation, MutationQueue
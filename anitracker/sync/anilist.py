@@ -1,14 +1,35 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Union, List, TYPE_CHECKING
+import asyncio
+import collections
+import functools
+import random
+import re
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    List,
+    TYPE_CHECKING,
+)
 import urllib.parse
 import webbrowser
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 
-from anitracker import user_agent
-from anitracker.gql import queries
+from anitracker import logger, user_agent
+from anitracker.gql import QueryRegistry
 from anitracker.media import Anime
 
 if TYPE_CHECKING:
@@ -18,32 +39,213 @@ BASE_URL = "https://anilist.co/api/v2"
 GQL_URL = "https://graphql.anilist.co"
 REDIRECT_URI = "https://anilist.co/api/v2/oauth/pin"
 
+# Read queries whose responses can be reused for a while, in seconds. Anilist
+# doesn't send ETags for graphql requests, so there's nothing to revalidate with
+RESPONSE_TTL = {"search_media": 5 * 60}
+MAX_CACHED_RESPONSES = 128
+
+# The variables SaveMediaListEntry takes, for building bulk mutations
+ENTRY_VARIABLE_TYPES = {
+    "id": "Int",
+    "mediaId": "Int",
+    "status": "MediaListStatus",
+    "score": "Float",
+    "progress": "Int",
+    "repeat": "Int",
+    "notes": "String",
+    "startedAt": "FuzzyDateInput",
+    "completedAt": "FuzzyDateInput",
+}
+ENTRY_FIELDS = """
+    id
+    mediaId
+    status
+    score
+    notes
+    progress
+    repeat
+    updatedAt
+    startedAt {year month day}
+    completedAt {year month day}
+"""
+# Where an error names one of the aliased mutations in a bulk request, either
+# through its path or one of its variables
+ALIAS_RE = re.compile(r"\ba(\d+)_")
+# Anything that means the request as a whole couldn't be run, rather than one
+# of the mutations in it being rejected
+TRANSIENT_STATUSES = (401, 403, 429)
+
+
+class RateLimiter:
+    """A client side token bucket for AniList's per minute request limit. It
+    starts at the documented limit, and is corrected from the rate limit headers
+    of every response. Requests that have to wait for a token are queued, and
+    the queue depth is reported through on_queue_change"""
+
+    def __init__(self, limit: int = 90, period: float = 60) -> None:
+        self.limit = limit
+        self.period = period
+        self.on_queue_change: Optional[Callable[[int], None]] = None
+
+        self._tokens = float(limit)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.limit, self._tokens + (now - self._updated) * self.limit / self.period
+        )
+        self._updated = now
+
+    def _delay(self) -> float:
+        """How long until a request can be sent, 0 if one can be right now"""
+        now = time.monotonic()
+        self._refill(now)
+
+        if self._blocked_until > now:
+            return self._blocked_until - now
+        if self._tokens >= 1:
+            return 0
+
+        return (1 - self._tokens) * self.period / self.limit
+
+    def _queue_changed(self, depth: int):
+        if self.on_queue_change is not None:
+            try:
+                self.on_queue_change(depth)
+            except Exception as e:
+                logger.error(
+                    "Could not report queue depth",
+                    exc_info=(type(e), e, e.__traceback__),
+                )
+
+    def acquire(self):
+        """Blocks until a request is allowed to be sent"""
+        with self._cond:
+            delay = self._delay()
+            if delay <= 0:
+                self._tokens -= 1
+                return
+
+            self._waiting += 1
+            depth = self._waiting
+
+        self._queue_changed(depth)
+
+        try:
+            with self._cond:
+                while (delay := self._delay()) > 0:
+                    self._cond.wait(delay)
+                self._tokens -= 1
+        finally:
+            with self._cond:
+                self._waiting -= 1
+                depth = self._waiting
+
+            self._queue_changed(depth)
+
+    def update(self, headers: Dict[str, str]):
+        """Corrects the bucket from the rate limit headers of a response"""
+        with self._cond:
+            if limit := headers.get("X-RateLimit-Limit"):
+                self.limit = int(limit)
+            if (remaining := headers.get("X-RateLimit-Remaining")) is not None:
+                self._refill(time.monotonic())
+                self._tokens = min(self._tokens, float(remaining))
+
+    def block(self, seconds: float):
+        """Stops any requests from being sent for this long"""
+        with self._cond:
+            self._tokens = 0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+def _backoff(attempt: int) -> float:
+    # Jittered so everything that was waiting doesn't retry at the same time
+    return min(30, 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _transient(status: Any) -> bool:
+    return isinstance(status, int) and (status in TRANSIENT_STATUSES or status >= 500)
+
+
+def _rejected_aliases(errors: List[Dict[str, Any]]) -> Set[int]:
+    """The aliases of a bulk mutation that errors point at"""
+    aliases: Set[int] = set()
+
+    for error in errors:
+        names = [str(part) for part in error.get("path") or []]
+        names.extend(error.get("validation") or {})
+        names.append(error.get("message") or "")
+        # The path is just the alias, which the regex wants followed by a _
+        aliases.update(int(n) for name in names for n in ALIAS_RE.findall(f"{name}_"))
+
+    return aliases
+
 
 class AniList:
-    def __init__(self) -> None:
+    def __init__(
+        self, *, pool_size: int = 10, timeout: float = 30, max_retries: int = 3
+    ) -> None:
         self.__access_token: Union[str, None] = None
         self.id: Union[int, None] = None
         self.name: Union[str, None] = None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = RateLimiter()
+        # How many mutations are packed into one bulk request. Anilist limits how
+        # complex a single request can be, so they can't all go in one
+        self.bulk_size = 25
+
+        self._queries = QueryRegistry()
+        self._responses: collections.OrderedDict[
+            Tuple[str, str], Tuple[float, Dict[Any, Any]]
+        ] = collections.OrderedDict()
+        self._responses_lock = threading.Lock()
+
+        # One session for everything, so connections are kept alive and reused
+        # instead of doing a new handshake for every request
+        self._session = requests.Session()
+        self._session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        )
+        self._session.headers.update(
+            {
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate",
+                "Content-Type": "application/json",
+                "User-Agent": user_agent,
+            }
+        )
 
     @property
     def headers(self) -> Dict[str, str]:
-        h = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "User-Agent": user_agent,
-        }
+        return dict(self._session.headers)
 
-        if self.__access_token:
-            h["Authorization"] = f"Bearer {self.__access_token}"
+    def _set_access_token(self, token: Union[str, None]):
+        self.__access_token = token
+
+        if token:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+        else:
+            self._session.headers.pop("Authorization", None)
 
-        return h
+    def close(self):
+        self._session.close()
 
     @property
     def authenticated(self) -> bool:
         return self.__access_token is not None
 
-    def _get_gql_query(self, name: str):
-        return getattr(queries, name)
+    def _get_gql_query(self, name: str, attributes: Optional[Iterable[str]] = None):
+        return self._queries.get(name, attributes)
 
     def from_config(self, config: Config):
         try:
@@ -51,21 +253,164 @@ class AniList:
         except KeyError:
             return
         else:
-            self.__access_token = token
-
-    def gql(self, query_name: str, variables: Dict[str, Any] = None) -> Dict[Any, Any]:
+            self._set_access_token(token)
+
+    def gql(
+        self,
+        query_name: str,
+        variables: Dict[str, Any] = None,
+        *,
+        attributes: Optional[Iterable[str]] = None,
+    ) -> Dict[Any, Any]:
+        """Sends a query, any media it selects only has the fields needed for
+        attributes if they're given"""
         if variables is None:
             variables = {}
 
-        query = self._get_gql_query(query_name)
+        query = self._get_gql_query(query_name, attributes)
+        ttl = RESPONSE_TTL.get(query_name)
+
+        if ttl is None:
+            return self._request(query_name, query, variables)
+
+        key = (query, json.dumps(variables, sort_keys=True))
+
+        with self._responses_lock:
+            cached = self._responses.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._responses.move_to_end(key)
+                return cached[1]
+
+        ret = self._request(query_name, query, variables)
+
+        if not ret.get("errors"):
+            with self._responses_lock:
+                self._responses[key] = (time.monotonic() + ttl, ret)
+                while len(self._responses) > MAX_CACHED_RESPONSES:
+                    self._responses.popitem(last=False)
+
+        return ret
+
+    def _request(
+        self,
+        query_name: str,
+        query: str,
+        variables: Dict[str, Any],
+        *,
+        raise_for_status: bool = False,
+    ) -> Dict[Any, Any]:
+        """Sends a request, retrying what's safe to retry. If raise_for_status
+        is set, an auth, rate limit or server error that's left after retrying
+        is raised as a requests.HTTPError instead of being returned"""
+        # Queries can always be retried, mutations only if they weren't run
+        idempotent = not query.lstrip().startswith("mutation")
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.limiter.acquire()
 
-        with requests.post(
-            GQL_URL, json={"query": query, "variables": variables}, headers=self.headers
-        ) as r:
             try:
+                r = self._session.post(
+                    GQL_URL,
+                    json={"query": query, "variables": variables},
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or last_attempt:
+                    raise
+                time.sleep(_backoff(attempt))
+                continue
+
+            with r:
+                self.limiter.update(r.headers)
+
+                # Rate limited requests aren't run, so these are safe to retry
+                if r.status_code == 429 and not last_attempt:
+                    retry_after = r.headers.get("Retry-After")
+                    delay = float(retry_after) if retry_after else _backoff(attempt)
+                    logger.info(f"Rate limited by anilist, waiting {delay} seconds")
+                    self.limiter.block(delay)
+                    continue
+                if r.status_code >= 500 and idempotent and not last_attempt:
+                    time.sleep(_backoff(attempt))
+                    continue
+
+                if raise_for_status and _transient(r.status_code):
+                    r.raise_for_status()
+
                 return r.json()
-            except json.JSONDecodeError:
-                raise
+
+        # Only reachable if every attempt was retried, which the last attempt never is
+        raise RuntimeError(f"Could not complete {query_name}")
+
+    def bulk_mutate(
+        self, mutations: List[Tuple[str, Dict[str, Any]]]
+    ) -> Iterator[List[Optional[Dict[str, Any]]]]:
+        """Sends many update_entry/delete_entry mutations, packed into as few
+        requests as possible with aliases. Yields what anilist returned for each
+        chunk as it's sent, None for any mutation anilist rejected. A chunk that
+        couldn't be sent at all, because of auth, rate limiting or a server
+        error, raises a requests.HTTPError so nothing in it counts as rejected"""
+        for i in range(0, len(mutations), self.bulk_size):
+            yield self._mutate_chunk(mutations[i : i + self.bulk_size])
+
+    def _mutate_chunk(
+        self, chunk: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        declarations: List[str] = []
+        fields: List[str] = []
+        variables: Dict[str, Any] = {}
+
+        for n, (kind, payload) in enumerate(chunk):
+            alias = f"a{n}"
+            arguments: List[str] = []
+
+            for key, value in payload.items():
+                variable = f"{alias}_{key}"
+                declarations.append(f"${variable}: {ENTRY_VARIABLE_TYPES[key]}")
+                arguments.append(f"{key}: ${variable}")
+                variables[variable] = value
+
+            if kind == "delete":
+                fields.append(
+                    f"{alias}: DeleteMediaListEntry({', '.join(arguments)}) {{ deleted }}"
+                )
+            else:
+                fields.append(
+                    f"{alias}: SaveMediaListEntry({', '.join(arguments)}) {{{ENTRY_FIELDS}}}"
+                )
+
+        body = "\n".join(fields)
+        query = f"mutation ({', '.join(declarations)}) {{\n{body}\n}}"
+        ret = self._request("bulk_mutate", query, variables, raise_for_status=True)
+        data = ret.get("data") or {}
+        errors = ret.get("errors") or []
+
+        if data or not errors:
+            return [data.get(f"a{n}") for n in range(len(chunk))]
+
+        # Some errors come back as a 200 or 400 with the real status in the body,
+        # an expired token is one of them
+        if any(
+            _transient(error.get("status")) or error.get("message") == "Invalid token"
+            for error in errors
+        ):
+            raise requests.HTTPError(
+                f"Anilist could not run bulk_mutate: {errors[0].get('message')}"
+            )
+
+        # One bad mutation failing validation fails the whole request, nothing
+        # in it was run. Only the ones anilist named were rejected, resend the rest
+        rejected = _rejected_aliases(errors) & set(range(len(chunk)))
+        if not rejected or len(rejected) == len(chunk):
+            return [None] * len(chunk)
+
+        rest = [n for n in range(len(chunk)) if n not in rejected]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+        for n, result in zip(rest, self._mutate_chunk([chunk[n] for n in rest])):
+            results[n] = result
+
+        return results
 
     def open_oauth(self):
         payload = {
@@ -89,6 +434,39 @@ class AniList:
     def get_manga(self) -> Dict[Any, Any]:
         return self._get_collection("MANGA")
 
+    def get_media(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """Returns the media for these ids, fetched a page's worth at a time"""
+        media: List[Dict[str, Any]] = []
+
+        for i in range(0, len(ids), 50):
+            ret = self.gql("media_by_ids", variables={"ids": ids[i : i + 50], "page": 1})
+            media.extend(ret["data"]["Page"]["media"])
+
+        return media
+
+    def get_updated_entries(self, _type: str, since: int) -> List[Dict[str, Any]]:
+        """Returns the list entries updated at or after the since timestamp,
+        newest first. Entries come sorted by when they were updated, so only the
+        pages up to the first older entry are fetched"""
+        entries: List[Dict[str, Any]] = []
+        page = 1
+
+        while True:
+            ret = self.gql(
+                "media_list_updates",
+                variables={"userId": self.id, "type": _type, "page": page},
+            )
+
+            for entry in ret["data"]["Page"]["mediaList"]:
+                if (entry["updatedAt"] or 0) < since:
+                    return entries
+                entries.append(entry)
+
+            if not ret["data"]["Page"]["pageInfo"]["hasNextPage"]:
+                return entries
+
+            page += 1
+
     def verify(self) -> Dict[Any, Any]:
         ret = self.gql("viewer")
 
@@ -101,12 +479,18 @@ class AniList:
         return ret
 
     def store_access(self, access_token: str):
-        self.__access_token = access_token
+        self._set_access_token(access_token)
 
-    def _search_media(self, query: str) -> List[Dict[str, Any]]:
+    def _search_media(
+        self, query: str, attributes: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, Any]]:
         results: List[Dict[str, Any]] = []
 
-        ret = self.gql("search_media", variables={"search": query, "page": 1})
+        ret = self.gql(
+            "search_media",
+            variables={"search": query, "page": 1},
+            attributes=attributes,
+        )
         results.extend(ret["data"]["Page"]["media"])
 
         while ret["data"]["Page"]["pageInfo"]["hasNextPage"]:
@@ -116,14 +500,19 @@ class AniList:
                     "search": query,
                     "page": ret["data"]["Page"]["pageInfo"]["currentPage"] + 1,
                 },
+                attributes=attributes,
             )
             results.extend(ret["data"]["Page"]["media"])
 
         return results
 
-    def search_anime(self, query: str) -> List[Anime]:
+    def search_anime(
+        self, query: str, attributes: Optional[Iterable[str]] = None
+    ) -> List[Anime]:
+        """Searches for anime, if attributes are given only what's needed for
+        them is fetched and anything else is left empty"""
         animes: List[Anime] = []
-        results = self._search_media(query)
+        results = self._search_media(query, attributes)
 
         for result in results:
             if result["format"] in ["MANGA", "NOVEL", "ONE_SHOT"]:
@@ -132,3 +521,83 @@ class AniList:
             animes.append(Anime.from_anilist(result))
 
         return animes
+
+
+class AsyncAniList:
+    """An asyncio front end for an AniList client. Requests still go through the
+    client's session and rate limiter, they're run in an executor so that
+    several of them can be waited on at once"""
+
+    def __init__(self, client: AniList, *, concurrency: int = 4) -> None:
+        self.client = client
+        self.concurrency = concurrency
+
+    async def gql(
+        self,
+        query_name: str,
+        variables: Dict[str, Any] = None,
+        *,
+        attributes: Optional[Iterable[str]] = None,
+    ) -> Dict[Any, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(
+                self.client.gql, query_name, variables, attributes=attributes
+            ),
+        )
+
+    async def _search_media(
+        self, query: str, attributes: Optional[Iterable[str]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yields each page of results as it arrives. The first page says how
+        many there are, the rest are then all fetched at once"""
+        ret = await self.gql(
+            "search_media",
+            variables={"search": query, "page": 1},
+            attributes=attributes,
+        )
+        page = ret["data"]["Page"]
+        yield page["media"]
+
+        if not page["pageInfo"]["hasNextPage"]:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(number: int) -> Dict[Any, Any]:
+            async with semaphore:
+                return await self.gql(
+                    "search_media",
+                    variables={"search": query, "page": number},
+                    attributes=attributes,
+                )
+
+        last_page = page["pageInfo"]["lastPage"]
+        tasks = [
+            asyncio.ensure_future(fetch(number)) for number in range(2, last_page + 1)
+        ]
+
+        try:
+            for future in asyncio.as_completed(tasks):
+                ret = await future
+                yield ret["data"]["Page"]["media"]
+        finally:
+            # Stopped early, nothing else needs to be fetched
+            for task in tasks:
+                task.cancel()
+
+    async def search_anime(
+        self, query: str, attributes: Optional[Iterable[str]] = None
+    ) -> AsyncIterator[Anime]:
+        results = self._search_media(query, attributes)
+
+        try:
+            async for page in results:
+                for result in page:
+                    if result["format"] in ["MANGA", "NOVEL", "ONE_SHOT"]:
+                        continue
+
+                    yield Anime.from_anilist(result)
+        finally:
+            await results.aclose()
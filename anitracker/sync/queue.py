@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from anitracker import logger
+
+if TYPE_CHECKING:
+    from anitracker.sync import AniList
+
+__all__ = ("Mutation", "MutationQueue")
+
+QUEUE_VERSION = 1
+# Mutations anilist keeps rejecting are dropped after this many tries
+MAX_ATTEMPTS = 5
+
+
+@dataclass
+class Mutation:
+    media_id: int
+    kind: str
+    payload: Dict[str, Any]
+    # Bumped whenever the mutation is coalesced with a newer one
+    version: int
+    attempts: int
+
+
+class MutationQueue:
+    """List edits waiting to be sent to anilist. They're written to disk before
+    anything is sent, so nothing is lost if anilist can't be reached or the app
+    is closed. There's only ever one mutation per entry, newer edits to an entry
+    are merged into the one already waiting"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._queued = threading.Event()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+
+        with self._lock, self._conn:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+
+            if version != QUEUE_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS mutations")
+
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS mutations (
+                    media_id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    queued REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(f"PRAGMA user_version = {QUEUE_VERSION}")
+
+        # Anything left over from last time should be sent as soon as possible
+        if len(self):
+            self._queued.set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM mutations").fetchone()[0]
+
+    def _get(self, media_id: int) -> Optional[Mutation]:
+        row = self._conn.execute(
+            "SELECT media_id, kind, payload, version, attempts FROM mutations WHERE media_id = ?",
+            (media_id,),
+        ).fetchone()
+
+        return self._from_row(row) if row is not None else None
+
+    @staticmethod
+    def _from_row(row: Tuple) -> Mutation:
+        return Mutation(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+    def _put_many(self, mutations: Iterable[Tuple[int, str, Dict[str, Any]]]):
+        # All in one transaction, so editing a whole selection only commits once
+        with self._lock, self._conn:
+            for media_id, kind, payload in mutations:
+                existing = self._get(media_id)
+                version = 0
+
+                if existing is not None:
+                    version = existing.version + 1
+                    # Updates are merged, anything newer always wins
+                    if existing.kind == kind == "update":
+                        payload = {**existing.payload, **payload}
+
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO mutations VALUES (?, ?, ?, ?, 0, ?)",
+                    (media_id, kind, json.dumps(payload), version, time.time()),
+                )
+
+        self._queued.set()
+
+    def _put(self, media_id: int, kind: str, payload: Dict[str, Any]):
+        self._put_many([(media_id, kind, payload)])
+
+    def update(self, media_id: int, payload: Dict[str, Any]):
+        """Queues an update_entry mutation for this media"""
+        self._put(media_id, "update", payload)
+
+    def update_many(self, payloads: Dict[int, Dict[str, Any]]):
+        """Queues update_entry mutations for many media, keyed by media id"""
+        self._put_many((media_id, "update", p) for media_id, p in payloads.items())
+
+    def delete(self, media_id: int, list_id: int):
+        """Queues a delete_entry mutation, dropping any update still waiting"""
+        self._put(media_id, "delete", {"id": list_id})
+
+    def delete_many(self, list_ids: Dict[int, int]):
+        """Queues delete_entry mutations for many media, media id to list id"""
+        self._put_many((media_id, "delete", {"id": i}) for media_id, i in list_ids.items())
+
+    def pending(self) -> List[Mutation]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT media_id, kind, payload, version, attempts FROM mutations ORDER BY queued"
+            ).fetchall()
+
+        return [self._from_row(row) for row in rows]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until something is queued, or the timeout passes"""
+        queued = self._queued.wait(timeout)
+        self._queued.clear()
+        return queued
+
+    def _done(self, mutation: Mutation):
+        # If it was changed while being sent, the newer one still needs sending
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM mutations WHERE media_id = ? AND version = ?",
+                (mutation.media_id, mutation.version),
+            )
+
+    def _failed(self, mutation: Mutation):
+        # Only for a mutation anilist rejected itself, one that couldn't be sent
+        # is left as it is. A newer edit starts its count over
+        with self._lock, self._conn:
+            if mutation.attempts + 1 >= MAX_ATTEMPTS:
+                logger.error(f"Giving up on {mutation}")
+                self._conn.execute(
+                    "DELETE FROM mutations WHERE media_id = ? AND version = ?",
+                    (mutation.media_id, mutation.version),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE mutations SET attempts = attempts + 1 WHERE media_id = ? AND version = ?",
+                    (mutation.media_id, mutation.version),
+                )
+
+    def flush(self, sync: AniList) -> Tuple[List[Tuple[Mutation, Dict]], bool]:
+        """Sends everything queued, oldest first, packed into as few requests as
+        possible. Returns the mutations that were sent along with what anilist
+        returned, and whether the queue was emptied. Flushing stops at the first
+        request that can't be sent, since anilist probably can't be reached or
+        the token needs renewing. Only mutations anilist rejects count towards
+        MAX_ATTEMPTS, the ones that weren't sent are kept as they are"""
+        done: List[Tuple[Mutation, Dict]] = []
+
+        with self._flush_lock:
+            pending = self.pending()
+            results = sync.bulk_mutate([(m.kind, m.payload) for m in pending])
+            sent = 0
+
+            try:
+                for chunk in results:
+                    for mutation, result in zip(pending[sent:], chunk):
+                        if result is None:
+                            logger.warning(f"Anilist rejected {mutation}")
+                            self._failed(mutation)
+                        else:
+                            self._done(mutation)
+                            done.append((mutation, result))
+
+                    sent += len(chunk)
+            except requests.RequestException as e:
+                logger.warning(f"Could not send {len(pending) - sent} changes: {e}")
+                return done, False
+
+        return done, not len(self)
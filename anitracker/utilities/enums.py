@@ -1,4 +1,4 @@
-from enum import Enum, auto
+from enum import Enum, IntEnum, auto
 
 
 class UserStatus(Enum):
@@ -21,3 +21,9 @@ class MediaStatus(Enum):
 class MediaType(Enum):
     ANIME = auto()
     MANGA = auto()
+
+
+class TaskPriority(IntEnum):
+    BACKGROUND = 0
+    NORMAL = 1
+    UI = 2
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+from typing import Dict, Set, Tuple
+
+from anitracker import logger
+
+__all__ = ("InotifyWatcher",)
+
+# These are all from sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+# struct inotify_event, the name follows it
+_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Watches every directory under the root with inotify, and reports
+    which directories had something change in them. Inotify isn't recursive,
+    so new directories get watched as they show up"""
+
+    def __init__(self, root: str) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on linux")
+
+        self.root = root
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd: int = self._libc.inotify_init1(IN_CLOEXEC)
+
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self._watches: Dict[int, str] = {}
+
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+
+        if wd < 0:
+            err = ctypes.get_errno()
+            # Out of watches, there's no point continuing with only part of the tree
+            if err == errno.ENOSPC:
+                raise OSError(err, "Ran out of inotify watches (fs.inotify.max_user_watches)")
+            # Otherwise it was probably removed before we got to it
+            return
+
+        self._watches[wd] = path
+
+    def _watch_tree(self, root: str):
+        visited: Set[Tuple[int, int]] = set()
+
+        for path, dirs, _ in os.walk(root, followlinks=True):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                dirs.clear()
+                continue
+
+            # Symlinks can create loops, don't walk the same directory twice
+            key = (stat.st_dev, stat.st_ino)
+            if key in visited:
+                dirs.clear()
+                continue
+            visited.add(key)
+
+            self._watch(path)
+
+    def _unwatch_tree(self, root: str):
+        for wd, path in list(self._watches.items()):
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def read(self, timeout: float) -> Set[str]:
+        """Waits up to timeout seconds for events, returning the directories
+        that changed. This is empty if nothing happened"""
+        changed: Set[str] = set()
+
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return changed
+
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            start = offset + _EVENT.size
+            name = os.fsdecode(data[start : start + length].rstrip(b"\0"))
+            offset = start + length
+
+            # Events were dropped, we have no idea what changed anymore
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Inotify queue overflowed, rescanning everything")
+                changed.add(self.root)
+                continue
+
+            path = self._watches.get(wd)
+            if path is None:
+                continue
+
+            # The watch was removed, either by us or because the directory is gone
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+
+            changed.add(path)
+
+            if mask & IN_ISDIR and name:
+                child = os.path.join(path, name)
+
+                # The paths for anything moved out are stale now, moving in re-adds them
+                if mask & IN_MOVED_FROM:
+                    self._unwatch_tree(child)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(child)
+                    changed.add(child)
+
+        return changed